@@ -33,12 +33,30 @@ bl_info = {
 
 if "bpy" in locals():
     import importlib
+    if "psd_reader" in locals():
+        importlib.reload(psd_reader)
+    if "layer_export" in locals():
+        importlib.reload(layer_export)
+    if "import_profile" in locals():
+        importlib.reload(import_profile)
+    if "layer_index" in locals():
+        importlib.reload(layer_index)
     if "io_import_psd_layers_as_planes" in locals():
         importlib.reload(io_import_psd_layers_as_planes)
 
 
-import bpy
-from . import io_import_psd_layers_as_planes
+try:
+    import bpy
+except ImportError:
+    # Not running in Blender, e.g. in a worker process of the parallel
+    # layer export. Only the bpy free modules can be used then.
+    bpy = None
+
+if bpy is not None:
+    # layer_export is imported when an import runs, it needs psd_tools.
+    # import_profile and layer_index are imported by the importer, which
+    # also puts them in the package namespace for the reload above.
+    from . import io_import_psd_layers_as_planes
 
 
 def menu_func_import(self, context):
@@ -47,16 +65,49 @@ def menu_func_import(self, context):
         text="Import PSD as planes", icon='IMAGE_DATA')
 
 
+def menu_func_watch(self, context):
+    if io_import_psd_layers_as_planes.is_watching():
+        text = "Stop watching PSD files"
+    else:
+        text = "Watch PSD files"
+    self.layout.operator(
+        io_import_psd_layers_as_planes.WatchPsdFiles.bl_idname,
+        text=text, icon='FILE_REFRESH')
+
+
+def menu_func_resolution(self, context):
+    self.layout.operator_menu_enum(
+        io_import_psd_layers_as_planes.SwitchLayerResolution.bl_idname, 'resolution',
+        text="PSD Layer Resolution")
+
+
 def register():
     bpy.utils.register_class(io_import_psd_layers_as_planes.ImportPsdAsPlanes)
+    bpy.utils.register_class(io_import_psd_layers_as_planes.SwitchLayerResolution)
+    bpy.utils.register_class(io_import_psd_layers_as_planes.WatchPsdFiles)
     bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
+    bpy.types.TOPBAR_MT_file_import.append(menu_func_watch)
     bpy.types.VIEW3D_MT_image_add.append(menu_func_import)
+    bpy.types.VIEW3D_MT_view.append(menu_func_resolution)
+    bpy.app.handlers.render_init.append(io_import_psd_layers_as_planes.show_full_resolution)
+    bpy.app.handlers.render_complete.append(io_import_psd_layers_as_planes.show_viewport_resolution)
+    bpy.app.handlers.render_cancel.append(io_import_psd_layers_as_planes.show_viewport_resolution)
+    bpy.app.handlers.load_post.append(io_import_psd_layers_as_planes.rescan_watch)
 
 
 def unregister():
+    io_import_psd_layers_as_planes.stop_watch()
     bpy.utils.unregister_class(io_import_psd_layers_as_planes.ImportPsdAsPlanes)
+    bpy.utils.unregister_class(io_import_psd_layers_as_planes.SwitchLayerResolution)
+    bpy.utils.unregister_class(io_import_psd_layers_as_planes.WatchPsdFiles)
     bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
+    bpy.types.TOPBAR_MT_file_import.remove(menu_func_watch)
     bpy.types.VIEW3D_MT_image_add.remove(menu_func_import)
+    bpy.types.VIEW3D_MT_view.remove(menu_func_resolution)
+    bpy.app.handlers.render_init.remove(io_import_psd_layers_as_planes.show_full_resolution)
+    bpy.app.handlers.render_complete.remove(io_import_psd_layers_as_planes.show_viewport_resolution)
+    bpy.app.handlers.render_cancel.remove(io_import_psd_layers_as_planes.show_viewport_resolution)
+    bpy.app.handlers.load_post.remove(io_import_psd_layers_as_planes.rescan_watch)
 
 
 if __name__ == "__main__":
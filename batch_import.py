@@ -0,0 +1,204 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Import psd files without the import operator, e.g. in background mode.
+#
+# From Python (for example with --python-expr):
+#
+#   from <add-on>.batch_import import import_psds
+#   import_psds(['/path/to/*.psd'], save=True, scale_fac=50)
+#
+# From the command line:
+#
+#   blender -b [target.blend] --python <add-on>/batch_import.py -- \
+#       [--save | --save-as out.blend] [--jobs N] \
+#       [--option NAME=VALUE ...] psd_or_dir_or_glob [...]
+
+
+import os
+import sys
+import glob
+import argparse
+import importlib
+import collections
+
+if __name__ == '__main__':
+    # Started as a script: run main() from the add-on package instead,
+    # relative imports only work there.
+    _addon_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(os.path.dirname(_addon_dir))
+    _module = importlib.import_module(os.path.basename(_addon_dir) + '.batch_import')
+    sys.exit(_module.main())
+
+if __name__ != '__mp_main__':
+    # The worker processes of the parallel export run the script again as
+    # __mp_main__, in plain Python without bpy. There it only defines the
+    # functions below.
+    import bpy
+    from . import io_import_psd_layers_as_planes as importer
+
+
+# Stands in for the operator's OperatorFileListElement
+FileListElement = collections.namedtuple('FileListElement', 'name')
+
+
+def get_default_options():
+    '''
+    get_default_options() -> dict options
+
+        Returns the default values of all properties of the import
+        operator, keyed by property name.
+    '''
+
+    options = {}
+    for name, prop in importer.ImportPsdAsPlanes.__annotations__.items():
+        keywords = getattr(prop, 'keywords', None)
+        if keywords is None:  # Before 2.93 properties are (function, keywords)
+            keywords = prop[1]
+        if 'default' in keywords:
+            options[name] = keywords['default']
+    return options
+
+
+class ImportOptions:
+
+    '''
+    Stands in for the import operator when importing without it. Has all
+    properties of the operator, with their default values unless they
+    are given, and a report() that prints.
+    '''
+
+    def __init__(self, psd_files, **options):
+        defaults = get_default_options()
+        unknown = set(options) - set(defaults)
+        if unknown:
+            raise TypeError('Unknown import options: {}'.format(', '.join(sorted(unknown))))
+        defaults.update(options)
+        for name, value in defaults.items():
+            setattr(self, name, value)
+        self.directory = ''
+        self.files = [FileListElement(os.path.abspath(f)) for f in psd_files]
+
+    @property
+    def properties(self):
+        return self
+
+    def report(self, type, message):
+        print('{}: {}'.format(', '.join(sorted(type)), message))
+
+
+def find_psd_files(paths):
+    '''
+    find_psd_files(list paths) -> list psd_files
+
+        Expands paths to psd files. A path can be a psd file, a directory
+        (all psd files in it) or a glob pattern.
+    '''
+
+    if isinstance(paths, str):
+        paths = [paths]
+    psd_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            path = os.path.join(path, '*.psd')
+        matches = sorted(glob.glob(path))
+        if not matches and os.path.isfile(path):
+            matches = [path]
+        psd_files.extend(m for m in matches if m not in psd_files)
+    return psd_files
+
+
+def import_psds(paths, blend_file=None, save=False, save_as=None, parse_workers=1, **options):
+    '''
+    import_psds(list paths, string blend_file, bool save, string save_as,
+                int parse_workers, **options) -> list psd_files
+
+        Imports psd files like the import operator does, but without
+        needing a UI context. Returns the psd files that were found.
+
+        list paths         - psd files, directories or glob patterns
+        string blend_file  - open this blend file first
+        bool save          - save the blend file when done
+        string save_as     - save the blend file to this path when done
+        int parse_workers  - number of psd files to parse at the same time
+        options            - properties of the import operator, for
+                             example scale_fac=50 or crop_layers=False
+    '''
+
+    psd_files = find_psd_files(paths)
+    options.setdefault('responsive', False)
+    import_options = ImportOptions(psd_files, **options)
+    if blend_file:
+        bpy.ops.wm.open_mainfile(filepath=blend_file)
+    if save_as and os.path.abspath(save_as) != bpy.data.filepath:
+        # Save first, so relative image paths are relative to the new file
+        bpy.ops.wm.save_as_mainfile(filepath=os.path.abspath(save_as))
+    if not psd_files:
+        print('No psd files found')
+        return psd_files
+    if bpy.context.object and bpy.context.object.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+    importer.run_steps(importer.import_files(import_options, bpy.context,
+                                             parse_workers=parse_workers))
+    if save or save_as:
+        if not bpy.data.filepath:
+            raise ValueError('Can not save an unsaved blend file, use save_as')
+        bpy.ops.wm.save_mainfile()
+    return psd_files
+
+
+def parse_option(option, defaults):
+    name, _, value = option.partition('=')
+    if name not in defaults:
+        raise argparse.ArgumentTypeError('unknown import option: {}'.format(name))
+    default = defaults[name]
+    if isinstance(default, bool):
+        if value.lower() not in ('1', '0', 'true', 'false', 'yes', 'no', 'on', 'off'):
+            raise argparse.ArgumentTypeError('{} needs a boolean value'.format(name))
+        return name, value.lower() in ('1', 'true', 'yes', 'on')
+    try:
+        return name, type(default)(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid value for {}: {}'.format(name, value))
+
+
+def main(argv=None):
+    '''
+    main(list argv) -> int exit_code
+
+        Command line interface of import_psds(). Reads the arguments after
+        '--' from sys.argv when argv is None.
+    '''
+
+    if argv is None:
+        argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    defaults = get_default_options()
+    parser = argparse.ArgumentParser(
+        prog='blender -b [file.blend] --python batch_import.py --',
+        description='Import psd files as planes.')
+    parser.add_argument('paths', nargs='+', help='psd files, directories or glob patterns')
+    parser.add_argument('-s', '--save', action='store_true', help='save the blend file when done')
+    parser.add_argument('-o', '--save-as', help='save the blend file to this path when done')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of psd files to parse at the same time')
+    parser.add_argument('--option', action='append', default=[], metavar='NAME=VALUE',
+                        type=lambda option: parse_option(option, defaults),
+                        help='import operator property, e.g. scale_fac=50 (repeatable)')
+    args = parser.parse_args(argv)
+    psd_files = import_psds(args.paths, save=args.save, save_as=args.save_as,
+                            parse_workers=args.jobs, **dict(args.option))
+    return 0 if psd_files else 1
@@ -0,0 +1,156 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Checks that the built-in psd reader (psd_reader.py) reads the same
+# layers as psd_tools. For every channel compression in 8 and 16 bits it
+# generates a psd file and compares the names, visibility and bounding
+# boxes of all layers and the cropped and uncropped pixels of the pixel
+# layers with what psd_tools' topil() gives. Exits with 1 when something
+# differs. Blender is not needed.
+#
+#   python check_reader.py
+#   python check_reader.py --keep psds/
+
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import importlib
+import numpy
+from psd_tools import PSDImage
+from psd_tools.constants import Compression
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.append(os.path.dirname(ADDON_DIR))
+sys.path.append(BENCHMARK_DIR)
+# The add-on's bpy free modules, without needing Blender
+layer_export = importlib.import_module(os.path.basename(ADDON_DIR) + '.layer_export')
+psd_reader = importlib.import_module(os.path.basename(ADDON_DIR) + '.psd_reader')
+import synthetic_psd
+
+
+# Arguments of synthetic_psd.make_psd(), besides the compression and bits.
+# Hidden layers, nested groups and layers as large as the canvas.
+PARAMS = dict(width=512, height=384, layers=24, depth=2, hidden=0.2,
+              layer_size=(1, 384), seed=1)
+
+BITS = (8, 16)
+
+
+def to_rgba(layer_image):
+    '''
+    to_rgba(PIL.Image layer_image) -> numpy.ndarray pixels
+    '''
+
+    return numpy.asarray(layer_image.convert('RGBA'))
+
+
+def compare_pixels(fast_layer, layer, crop):
+    '''
+    compare_pixels(psd_reader.Layer fast_layer, psd_tools layer, bool crop) -> string difference
+
+        Decodes fast_layer like the import does and compares it with
+        topil() of the psd_tools layer. Returns what differs, or None.
+    '''
+
+    fast_image, fast_bbox = layer_export.decode_layer(fast_layer, crop)
+    image = layer.topil()
+    bbox = None
+    if crop:
+        bbox = image.getbbox()
+        image = image.crop(bbox)
+    if fast_bbox != bbox:
+        return 'crop {} instead of {}'.format(fast_bbox, bbox)
+    fast_pixels, pixels = to_rgba(fast_image), to_rgba(image)
+    if fast_pixels.shape != pixels.shape:
+        return 'size {} instead of {}'.format(fast_pixels.shape, pixels.shape)
+    different = numpy.count_nonzero((fast_pixels != pixels).any(axis=2))
+    if different:
+        return '{} different pixels'.format(different)
+    return None
+
+
+def check_psd(psd_file):
+    '''
+    check_psd(string psd_file) -> list differences
+
+        Compares the layers psd_reader reads from psd_file with the layers
+        of psd_tools. Returns a line for every difference.
+    '''
+
+    differences = []
+    psd = PSDImage.open(psd_file)
+    with psd_reader.PSDFile(psd_file) as fast_psd:
+        if fast_psd.size != psd.size:
+            differences.append('canvas {} instead of {}'.format(fast_psd.size, psd.size))
+        layers = layer_export.get_layers(psd)
+        fast_layers = layer_export.get_layers(fast_psd)
+        if len(fast_layers) != len(layers):
+            differences.append('{} layers instead of {}'.format(len(fast_layers), len(layers)))
+        for fast_layer, layer in zip(fast_layers, layers):
+            found = []
+            if fast_layer.name != layer.name:
+                found.append('name {!r}'.format(fast_layer.name))
+            if fast_layer.is_group() != layer.is_group():
+                found.append('group {}'.format(fast_layer.is_group()))
+            if fast_layer.visible != layer.visible:
+                found.append('visible {}'.format(fast_layer.visible))
+            if tuple(fast_layer.bbox) != tuple(layer.bbox):
+                found.append('bbox {} instead of {}'.format(tuple(fast_layer.bbox), tuple(layer.bbox)))
+            if not found and not layer.is_group() and layer.width and layer.height:
+                for crop in (False, True):
+                    difference = compare_pixels(fast_layer, layer, crop)
+                    if difference:
+                        found.append(difference + (' (cropped)' if crop else ''))
+            differences.extend('{}: {}'.format(layer.name, line) for line in found)
+    return differences
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the built-in psd reader with psd_tools.')
+    parser.add_argument('--keep', metavar='DIR',
+                        help='directory to keep the generated psd files in, they are deleted otherwise')
+    args = parser.parse_args(argv)
+
+    psd_dir = args.keep or tempfile.mkdtemp(prefix='check_reader_')
+    os.makedirs(psd_dir, exist_ok=True)
+    failed = False
+    try:
+        for compression in Compression:
+            for bits in BITS:
+                params = dict(PARAMS, compression=compression, bits=bits)
+                psd_file = os.path.join(psd_dir, synthetic_psd.psd_file_name(**params))
+                if not os.path.isfile(psd_file):
+                    synthetic_psd.make_psd(psd_file, **params)
+                differences = check_psd(psd_file)
+                print('{:<20} {:>2} bit  {}'.format(
+                    compression.name, bits, 'differs' if differences else 'ok'))
+                for line in differences:
+                    print('  - ' + line)
+                failed = failed or bool(differences)
+    finally:
+        if not args.keep:
+            shutil.rmtree(psd_dir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
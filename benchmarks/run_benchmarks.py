@@ -0,0 +1,320 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Benchmarks of the psd import on synthetic psd files.
+#
+# The parse stage (opening the psd file and exporting the layers) runs in
+# a plain Python interpreter. With --blender the whole import also runs
+# in Blender in background mode, through batch_import.py.
+# Every run is a new process, so runs don't share memory or caches. The
+# psd files are generated once and reused.
+# With --blender the time it takes to import and register the add-on is
+# measured as well, it should stay within STARTUP_BUDGET.
+#
+#   python run_benchmarks.py --repeat 3 --output before.json
+#   python run_benchmarks.py --repeat 3 --compare before.json --blender blender
+
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import importlib
+import subprocess
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.append(os.path.dirname(ADDON_DIR))
+sys.path.append(BENCHMARK_DIR)
+# The add-on's bpy free modules, without needing Blender
+layer_export = importlib.import_module(os.path.basename(ADDON_DIR) + '.layer_export')
+import_profile = importlib.import_module(os.path.basename(ADDON_DIR) + '.import_profile')
+import synthetic_psd
+
+
+RESULTS_VERSION = 1
+
+# Seconds enabling the add-on may take when Blender starts
+STARTUP_BUDGET = 0.1
+# Modules the add-on should only import when psd files are imported
+HEAVY_MODULES = ('psd_tools', 'PIL', 'numpy')
+
+# Runs in Blender, imports and registers the add-on and prints the time
+STARTUP_SCRIPT = '''
+import sys, time, json, importlib
+sys.path.append({addon_parent!r})
+loaded = set(sys.modules)
+start = time.perf_counter()
+addon = importlib.import_module({addon_name!r})
+addon.register()
+seconds = time.perf_counter() - start
+modules = [name for name in {heavy_modules!r} if name in sys.modules and name not in loaded]
+print('STARTUP ' + json.dumps({{'time': seconds, 'heavy_modules': modules}}))
+'''
+
+# Arguments of synthetic_psd.make_psd() per scenario
+SCENARIOS = {
+    'basic': dict(width=2048, height=2048, layers=100, depth=2, hidden=0.1,
+                  layer_size=(64, 512)),
+    'many_layers': dict(width=4096, height=4096, layers=1000, depth=3, hidden=0.1,
+                        layer_size=(16, 256)),
+    'deep_nesting': dict(width=2048, height=2048, layers=200, depth=10, hidden=0.1,
+                         layer_size=(32, 256)),
+    'huge_canvas': dict(width=16384, height=16384, layers=40, depth=2, hidden=0.1,
+                        layer_size=(512, 4096)),
+    }
+
+
+def get_psd(scenario, psd_dir):
+    '''
+    get_psd(string scenario, string psd_dir) -> string psd_file
+
+        Returns the psd file of scenario, generates it when it isn't in
+        psd_dir yet.
+    '''
+
+    params = SCENARIOS[scenario]
+    psd_file = os.path.join(psd_dir, synthetic_psd.psd_file_name(**params))
+    if not os.path.isfile(psd_file):
+        print('generating {} psd: {}'.format(scenario, psd_file))
+        os.makedirs(psd_dir, exist_ok=True)
+        tmp_file = psd_file + '.tmp'
+        synthetic_psd.make_psd(tmp_file, **params)
+        os.replace(tmp_file, psd_file)
+    return psd_file
+
+
+def parse(psd_file, png_dir, workers=1, crop=True, fast_reader=True):
+    '''
+    parse(string psd_file, string png_dir, int workers, bool crop,
+          bool fast_reader) -> dict result
+
+        Opens psd_file and exports its visible layers to png_dir, like
+        the import does, with the built-in reader or psd_tools. Returns
+        the wall time, the time per stage and the peak memory. Stage
+        times of a parallel export are summed over the worker processes.
+    '''
+
+    profile = import_profile.ImportProfile(psd_file)
+    start = time.perf_counter()
+    with profile.stage('open_psd'):
+        psd = layer_export.open_psd(psd_file, fast_reader)
+        layers = layer_export.get_layers(psd)
+    jobs = [(i, os.path.join(png_dir, 'layer_{}.png'.format(i)))
+            for i, layer in enumerate(layers)
+            if not layer.is_group() and layer.is_visible()]
+    if workers == 1:
+        for i, png_file in jobs:
+            timings = {}
+            layer_export.export_layer(layers[i], png_file, crop, timings)
+            for stage, seconds in timings.items():
+                profile.add_time(stage, seconds)
+    else:
+        for i, result, timings in layer_export.export_layers_parallel(
+                psd_file, jobs, crop, workers=workers, executable=sys.executable,
+                fast_reader=fast_reader):
+            for stage, seconds in timings.items():
+                profile.add_time(stage, seconds)
+    wall_time = time.perf_counter() - start
+    report = profile.report()
+    return {'time': wall_time,
+            'stages': {name: stage['time'] for name, stage in report['stages'].items()},
+            'layers': len(layers),
+            'exported_layers': len(jobs),
+            'peak_memory': report['peak_memory']}
+
+
+def run_parse(psd_file, workers, fast_reader=True):
+    # In a new process, so the peak memory is of this run only
+    png_dir = tempfile.mkdtemp(prefix='psd_benchmark_')
+    command = [sys.executable, os.path.abspath(__file__), '--parse-only', psd_file,
+               '--png-dir', png_dir, '--workers', str(workers)]
+    if not fast_reader:
+        command.append('--psd-tools')
+    try:
+        output = subprocess.check_output(command)
+    finally:
+        shutil.rmtree(png_dir, ignore_errors=True)
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def run_import(psd_file, blender, options):
+    '''
+    run_import(string psd_file, string blender, list options) -> dict result
+
+        Imports psd_file in a new background Blender with the timing
+        report enabled and the export cache disabled, and returns the
+        times of the report. process_time includes starting Blender.
+    '''
+
+    psd_dir, psd_name = os.path.split(psd_file)
+    png_dir = os.path.join(psd_dir, os.path.splitext(psd_name)[0] + '_pngs')
+    shutil.rmtree(png_dir, ignore_errors=True)
+    report_file = import_profile.report_path(psd_file)
+    if os.path.isfile(report_file):
+        os.remove(report_file)
+    command = [blender, '-b', '--factory-startup',
+               '--python', os.path.join(ADDON_DIR, 'batch_import.py'), '--',
+               '--option', 'write_report=true', '--option', 'use_export_cache=false']
+    for option in options:
+        command.extend(('--option', option))
+    command.append(psd_file)
+    start = time.perf_counter()
+    subprocess.check_call(command, stdout=subprocess.DEVNULL)
+    process_time = time.perf_counter() - start
+    with open(report_file) as f:
+        report = json.load(f)
+    return {'time': report['wall_time'],
+            'process_time': process_time,
+            'stages': {name: stage['time'] for name, stage in report['stages'].items()},
+            'counts': report['counts'],
+            'peak_memory': report['peak_memory']}
+
+
+def run_startup(blender):
+    '''
+    run_startup(string blender) -> dict result
+
+        Imports and registers the add-on in a new background Blender.
+        Returns the time that took and the heavy modules it imported
+        that Blender itself hadn't imported yet.
+    '''
+
+    script = STARTUP_SCRIPT.format(addon_parent=os.path.dirname(ADDON_DIR),
+                                   addon_name=os.path.basename(ADDON_DIR),
+                                   heavy_modules=HEAVY_MODULES)
+    output = subprocess.check_output([blender, '-b', '--factory-startup', '--python-expr', script])
+    for line in output.decode().splitlines():
+        if line.startswith('STARTUP '):
+            return json.loads(line[len('STARTUP '):])
+    raise RuntimeError('the add-on could not be registered')
+
+
+def best_run(runs):
+    # The fastest run is the least disturbed by other processes
+    best = dict(min(runs, key=lambda run: run['time']))
+    best['runs'] = [run['time'] for run in runs]
+    return best
+
+
+def get_environment():
+    return {'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'psd_tools': layer_export.psd_tools.__version__}
+
+
+def compare(results, baseline):
+    '''
+    compare(dict results, dict baseline)
+
+        Prints the times of results next to those of baseline.
+    '''
+
+    print('\n{:<14} {:<7} {:>10} {:>10} {:>8}'.format('scenario', 'stage', 'baseline', 'now', 'change'))
+    if 'startup' in results and 'startup' in baseline:
+        old, new = baseline['startup']['time'], results['startup']['time']
+        print('{:<14} {:<7} {:>9.3f}s {:>9.3f}s {:>+7.1f}%'.format(
+            'add-on', 'startup', old, new, (new - old) / old * 100))
+    for scenario, kinds in sorted(results['scenarios'].items()):
+        for kind, result in sorted(kinds.items()):
+            old = baseline.get('scenarios', {}).get(scenario, {}).get(kind)
+            if old is None or old.get('params') != result.get('params'):
+                print('{:<14} {:<7} {:>10} {:>9.2f}s {:>8}'.format(scenario, kind, '-', result['time'], ''))
+                continue
+            change = (result['time'] - old['time']) / old['time'] * 100
+            print('{:<14} {:<7} {:>9.2f}s {:>9.2f}s {:>+7.1f}%'.format(
+                scenario, kind, old['time'], result['time'], change))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the psd import on synthetic psd files.')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run (repeatable), default all')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per scenario, the fastest counts')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='export processes of the parse stage, 1 exports serially')
+    parser.add_argument('--psd-tools', action='store_true',
+                        help='read the psd files with psd_tools in the parse stage, not the built-in reader')
+    parser.add_argument('--blender',
+                        help='Blender executable, also benchmark the whole import and the add-on startup')
+    parser.add_argument('--option', action='append', default=[], metavar='NAME=VALUE',
+                        help='import operator property for the Blender import (repeatable)')
+    parser.add_argument('--psd-dir', default=os.path.join(tempfile.gettempdir(), 'psd_import_benchmarks'),
+                        help='where the generated psd files are kept')
+    parser.add_argument('--output', help='save the results as JSON')
+    parser.add_argument('--compare', help='results JSON of an earlier run to compare with')
+    parser.add_argument('--parse-only', metavar='PSD_FILE', help=argparse.SUPPRESS)
+    parser.add_argument('--png-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.parse_only:
+        # A single parse run, started by run_parse()
+        print(json.dumps(parse(args.parse_only, args.png_dir, args.workers,
+                               fast_reader=not args.psd_tools)))
+        return 0
+
+    results = {'version': RESULTS_VERSION,
+               'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'environment': get_environment(),
+               'workers': args.workers,
+               'import_options': args.option,
+               'scenarios': {}}
+    if args.blender:
+        print('add-on startup')
+        results['startup'] = best_run([run_startup(args.blender) for _ in range(args.repeat)])
+        startup = results['startup']
+        print('  {:.3f}s'.format(startup['time']))
+        if startup['time'] > STARTUP_BUDGET:
+            print('  over the budget of {:.3f}s'.format(STARTUP_BUDGET))
+        if startup['heavy_modules']:
+            print('  imported {}'.format(', '.join(startup['heavy_modules'])))
+    for scenario in args.scenario or sorted(SCENARIOS):
+        psd_file = get_psd(scenario, args.psd_dir)
+        params = dict(SCENARIOS[scenario], layer_size=list(SCENARIOS[scenario]['layer_size']))
+        kinds = results['scenarios'][scenario] = {}
+        print('{}: parse'.format(scenario))
+        kinds['parse'] = best_run([run_parse(psd_file, args.workers, not args.psd_tools)
+                                   for _ in range(args.repeat)])
+        kinds['parse']['params'] = dict(params, workers=args.workers)
+        if args.psd_tools:
+            kinds['parse']['params']['reader'] = 'psd_tools'
+        print('  {:.2f}s'.format(kinds['parse']['time']))
+        if args.blender:
+            print('{}: import'.format(scenario))
+            kinds['import'] = best_run([run_import(psd_file, args.blender, args.option)
+                                        for _ in range(args.repeat)])
+            kinds['import']['params'] = dict(params, options=args.option)
+            print('  {:.2f}s'.format(kinds['import']['time']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
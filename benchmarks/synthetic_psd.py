@@ -0,0 +1,143 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Generates psd files to benchmark the import with. Needs a psd_tools
+# version that can create layers (PSDImage.new, PixelLayer.frompil and
+# Group.new), numpy and Pillow. Blender is not needed.
+#
+#   python synthetic_psd.py out.psd --size 4096 4096 --layers 1000 --depth 3
+#   python synthetic_psd.py out.psd --compression ZIP --bits 16
+
+
+import random
+import argparse
+import numpy
+from PIL import Image
+from psd_tools import PSDImage
+from psd_tools.constants import Compression
+from psd_tools.api.layers import PixelLayer, Group
+
+
+# Part of the file names of the generated psd files, change it when the
+# generated content changes so old files aren't reused.
+GENERATOR_VERSION = 1
+
+
+def make_layer_image(width, height, rng):
+    '''
+    make_layer_image(int width, int height, random.Random rng) -> PIL.Image image
+
+        Returns an RGBA image with a gradient filled ellipse. The ellipse
+        leaves a transparent margin, so cropping has something to do.
+    '''
+
+    y, x = numpy.mgrid[0:height, 0:width].astype(numpy.float32)
+    x = (x + 0.5) / width * 2 - 1
+    y = (y + 0.5) / height * 2 - 1
+    margin = rng.uniform(0.6, 0.95)
+    inside = (x * x + y * y) <= margin * margin
+    pixels = numpy.empty((height, width, 4), dtype=numpy.uint8)
+    for channel in range(3):
+        start, end = rng.randrange(256), rng.randrange(256)
+        direction = x if channel % 2 else y
+        pixels[..., channel] = start + (end - start) * (direction + 1) / 2
+    pixels[..., 3] = numpy.where(inside, 255, 0)
+    return Image.fromarray(pixels, 'RGBA')
+
+
+def make_psd(psd_file, width, height, layers, depth=0, hidden=0.0,
+             layer_size=(64, 512), seed=0, compression=Compression.RLE, bits=8):
+    '''
+    make_psd(string psd_file, int width, int height, int layers, int depth,
+             float hidden, tuple layer_size, int seed, Compression compression,
+             int bits)
+
+        Creates a psd file with layers pixel layers. The same arguments
+        always give the same file.
+
+        string psd_file   - where to save the psd file
+        int width         - width of the canvas
+        int height        - height of the canvas
+        int layers        - number of pixel layers
+        int depth         - number of nested group levels, the layers are
+                            spread evenly over the top level and the groups
+        float hidden      - fraction of the layers that is hidden (0 - 1)
+        tuple layer_size  - minimum and maximum width and height of a layer,
+                            never larger than the canvas
+        int seed          - seed of the random sizes, positions and colors
+        Compression compression - compression of the layer channels
+        int bits          - bits per channel, 8 or 16
+    '''
+
+    rng = random.Random(seed)
+    psd = PSDImage.new('RGBA', (width, height), depth=bits, compression=compression)
+    parents = [psd]
+    for level in range(depth):
+        parents.append(Group.new(parents[-1], name='group {}'.format(level + 1)))
+    hidden_layers = set(rng.sample(range(layers), int(round(layers * hidden))))
+    min_size, max_size = layer_size
+    for i in range(layers):
+        layer_width = min(rng.randint(min_size, max_size), width)
+        layer_height = min(rng.randint(min_size, max_size), height)
+        image = make_layer_image(layer_width, layer_height, rng)
+        layer = PixelLayer.frompil(image, parents[i % len(parents)],
+                                   name='layer {}'.format(i),
+                                   top=rng.randint(0, height - layer_height),
+                                   left=rng.randint(0, width - layer_width),
+                                   compression=compression)
+        if i in hidden_layers:
+            layer.visible = False
+    # PSDImage.save() composites all layers into the merged image first,
+    # which takes very long on large canvases. The import doesn't use the
+    # merged image, so the blank one of PSDImage.new() is written instead.
+    with open(psd_file, 'wb') as f:
+        psd._record.write(f)
+
+
+def psd_file_name(width, height, layers, depth=0, hidden=0.0, layer_size=(64, 512), seed=0,
+                  compression=Compression.RLE, bits=8):
+    '''
+    psd_file_name(...) -> string name
+
+        Returns a file name that is unique for the arguments of make_psd().
+    '''
+
+    return 'synthetic_v{}_{}x{}_l{}_d{}_h{}_s{}-{}_r{}_c{}_b{}.psd'.format(
+        GENERATOR_VERSION, width, height, layers, depth, int(hidden * 100),
+        layer_size[0], layer_size[1], seed, int(compression), bits)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Create a synthetic psd file.')
+    parser.add_argument('psd_file')
+    parser.add_argument('--size', type=int, nargs=2, default=(2048, 2048), metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--layers', type=int, default=100)
+    parser.add_argument('--depth', type=int, default=0, help='levels of nested groups')
+    parser.add_argument('--hidden', type=float, default=0.0, help='fraction of hidden layers')
+    parser.add_argument('--layer-size', type=int, nargs=2, default=(64, 512), metavar=('MIN', 'MAX'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compression', choices=[c.name for c in Compression], default='RLE')
+    parser.add_argument('--bits', type=int, choices=(8, 16), default=8, help='bits per channel')
+    args = parser.parse_args(argv)
+    make_psd(args.psd_file, args.size[0], args.size[1], args.layers, args.depth,
+             args.hidden, tuple(args.layer_size), args.seed,
+             Compression[args.compression], args.bits)
+
+
+if __name__ == '__main__':
+    main()
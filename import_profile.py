@@ -0,0 +1,198 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Timing of the import stages. Doesn't import bpy, so the benchmarks can
+# use it without Blender.
+
+
+import os
+import sys
+import json
+import time
+import pstats
+import contextlib
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+REPORT_VERSION = 1
+
+
+def peak_memory():
+    '''
+    peak_memory() -> int peak
+
+        Returns the peak resident memory of this process in bytes, or
+        None when the platform can't tell.
+    '''
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':  # Bytes on macOS, kilobytes elsewhere
+        return peak
+    return peak * 1024
+
+
+def profiled_steps(steps, profiler):
+    '''
+    profiled_steps(iterator steps, cProfile.Profile profiler) -> iterator
+
+        Runs the progress generator steps with profiler enabled and
+        returns its result. The profiler is disabled in between the
+        steps, so what Blender does in the meantime is left out.
+    '''
+
+    try:
+        while True:
+            profiler.enable()
+            try:
+                progress = next(steps)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                profiler.disable()
+            yield progress
+    finally:
+        steps.close()
+
+
+class ImportProfile:
+
+    '''
+    Collects the time spent in the stages of the import of one psd file,
+    in total and per layer, and counts of what the import did.
+    The time of a stage is only measured while it runs, so when the
+    import runs in steps the time between the steps is not included.
+    '''
+
+    def __init__(self, psd_file):
+        self.psd_file = psd_file
+        # stage -> [seconds, calls]
+        self.stages = {}
+        # layer -> {stage: seconds}
+        self.layers = {}
+        self.counts = {}
+        self.cprofile = None
+        self.peak_memory_start = peak_memory()
+        self.start_time = time.perf_counter()
+        self.end_time = None
+
+    @contextlib.contextmanager
+    def stage(self, name, layer=None):
+        '''
+        stage(string name, string layer)
+
+            Context manager that adds the time spent in it to stage name
+            and, when given, to the stages of layer.
+        '''
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start, layer)
+
+    def add_time(self, name, seconds, layer=None):
+        stage = self.stages.setdefault(name, [0.0, 0])
+        stage[0] += seconds
+        stage[1] += 1
+        if layer is not None:
+            layer_stages = self.layers.setdefault(layer, {})
+            layer_stages[name] = layer_stages.get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def finish(self):
+        self.end_time = time.perf_counter()
+
+    def add_cprofile(self, profiler, stats_file, top=30):
+        '''
+        add_cprofile(cProfile.Profile profiler, string stats_file, int top)
+
+            Saves the statistics of profiler to stats_file (open it with
+            pstats or snakeviz) and adds the top functions by cumulative
+            time to the report.
+        '''
+
+        profiler.dump_stats(stats_file)
+        stats = pstats.Stats(profiler).stats
+        functions = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+        self.cprofile = {
+            'stats_file': stats_file,
+            'top_cumulative': [{'function': '{}:{}({})'.format(*func),
+                                'calls': calls,
+                                'total_time': total_time,
+                                'cumulative_time': cumulative_time}
+                               for func, (primitive_calls, calls, total_time, cumulative_time, callers)
+                               in functions]}
+
+    def report(self):
+        '''
+        report() -> dict report
+
+            Returns everything that was measured, ready to be saved as JSON.
+        '''
+
+        end_time = self.end_time if self.end_time is not None else time.perf_counter()
+        return {
+            'version': REPORT_VERSION,
+            'psd_file': self.psd_file,
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'wall_time': end_time - self.start_time,
+            'stages': {name: {'time': seconds, 'calls': calls}
+                       for name, (seconds, calls) in self.stages.items()},
+            'counts': self.counts,
+            'peak_memory_start': self.peak_memory_start,
+            'peak_memory': peak_memory(),
+            'layers': self.layers,
+            'cprofile': self.cprofile,
+            }
+
+    def save(self, report_file):
+        with open(report_file, 'w') as f:
+            json.dump(self.report(), f, indent=1, sort_keys=True)
+
+    def summary(self):
+        '''
+        summary() -> string summary
+
+            Returns the stages from slowest to fastest, one per line.
+        '''
+
+        lines = []
+        for name, (seconds, calls) in sorted(self.stages.items(), key=lambda item: -item[1][0]):
+            lines.append('    {:<20} {:8.3f} s  ({} x)'.format(name, seconds, calls))
+        return '\n'.join(lines)
+
+
+def report_path(psd_file, extension='.json'):
+    '''
+    report_path(string psd_file, string extension) -> string report_file
+
+        Returns where the report of the import of psd_file goes: next to
+        its png directory, as <psd name>_import_report<extension>.
+    '''
+
+    psd_dir, psd_name = os.path.split(psd_file)
+    psd_name = os.path.splitext(psd_name)[0]
+    return os.path.join(psd_dir, ''.join((psd_name, '_import_report', extension)))
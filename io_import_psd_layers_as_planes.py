@@ -18,20 +18,512 @@
 
 
 import os
+import re
+import sys
 import time
+import cProfile
+import concurrent.futures
 import random
+import shutil
 import string
-import psd_tools
+import traceback
 import bpy
-from mathutils import Vector
+from mathutils import Matrix, Vector
 from bpy.props import (BoolProperty,
                        StringProperty,
                        FloatProperty,
+                       IntProperty,
                        EnumProperty,
                        CollectionProperty)
+from bpy.app.handlers import persistent
 from bpy_extras.io_utils import (ImportHelper,
                                  orientation_helper,
                                  axis_conversion)
+from . import import_profile
+from . import layer_index
+
+# psd_tools, Pillow and numpy take long to import and may not even be
+# installed, so they (and layer_export, which needs them) are only
+# imported when psd files are imported. See load_dependencies().
+psd_tools = None
+layer_export = None
+
+
+# Seconds between progress updates
+PROGRESS_INTERVAL = 0.1
+# Seconds of work the responsive import does before handing back to the UI
+TIME_SLICE = 0.05
+# Seconds between checks of the watched psd files
+WATCH_INTERVAL = 1.0
+# Seconds a changed psd file has to stay the same before it is imported again
+WATCH_DEBOUNCE = 2.0
+
+# UVs of the plane, in the loop order of its face
+PLANE_UVS = (0, 0, 1, 0, 1, 1, 0, 1)
+# Face of the plane, see get_plane_verts()
+PLANE_FACES = [(3, 2, 1, 0)]
+
+
+LAYER_SHADER_GROUP = 'PSD Layer Shader'
+
+# Resolutions of the layer images, how many times smaller than the layer
+RESOLUTIONS = (('1', 'Full', 'Full resolution images'),
+               ('2', 'Half', 'Proxy images of half the size'),
+               ('4', 'Quarter', 'Proxy images of a quarter of the size'))
+
+
+def get_layer_shader_group():
+    '''
+    get_layer_shader_group() -> ShaderNodeTree node_group
+
+        Returns the node group with the shader all layer materials share,
+        creating it when it does not exist yet.
+        The group has a Color and an Alpha input and outputs the color as
+        emission, mixed with transparency according to alpha.
+    '''
+
+    node_group = bpy.data.node_groups.get(LAYER_SHADER_GROUP)
+    if node_group is not None and node_group.bl_idname == 'ShaderNodeTree':
+        return node_group
+    node_group = bpy.data.node_groups.new(LAYER_SHADER_GROUP, 'ShaderNodeTree')
+    if hasattr(node_group, 'interface'):  # Blender 4.0+
+        node_group.interface.new_socket('Color', in_out='INPUT', socket_type='NodeSocketColor')
+        node_group.interface.new_socket('Alpha', in_out='INPUT', socket_type='NodeSocketFloat')
+        node_group.interface.new_socket('Shader', in_out='OUTPUT', socket_type='NodeSocketShader')
+    else:
+        node_group.inputs.new('NodeSocketColor', 'Color')
+        node_group.inputs.new('NodeSocketFloat', 'Alpha')
+        node_group.outputs.new('NodeSocketShader', 'Shader')
+    nodes = node_group.nodes
+    # Create nodes
+    group_input = nodes.new('NodeGroupInput')
+    light_path = nodes.new('ShaderNodeLightPath')
+    math_max1 = nodes.new('ShaderNodeMath')
+    math_max2 = nodes.new('ShaderNodeMath')
+    emission = nodes.new('ShaderNodeEmission')
+    transparent = nodes.new('ShaderNodeBsdfTransparent')
+    mix = nodes.new('ShaderNodeMixShader')
+    group_output = nodes.new('NodeGroupOutput')
+    # Set options
+    math_max1.operation = 'MAXIMUM'
+    math_max2.operation = 'MAXIMUM'
+    # Connect nodes
+    node_group.links.new(math_max1.inputs[0], light_path.outputs[0])
+    node_group.links.new(math_max1.inputs[1], light_path.outputs[3])
+    node_group.links.new(math_max2.inputs[0], math_max1.outputs[0])
+    node_group.links.new(math_max2.inputs[1], light_path.outputs[6])
+    node_group.links.new(emission.inputs[0], group_input.outputs[0])
+    node_group.links.new(emission.inputs[1], math_max2.outputs[0])
+    node_group.links.new(mix.inputs[0], group_input.outputs[1])
+    node_group.links.new(mix.inputs[1], transparent.outputs[0])
+    node_group.links.new(mix.inputs[2], emission.outputs[0])
+    node_group.links.new(group_output.inputs[0], mix.outputs[0])
+    # Hide unused sockets of Light Path node
+    for output in light_path.outputs:
+        if not output.links:
+            output.hide = True
+    # Position nodes nicely
+    group_input.location = (-840, 160)
+    light_path.location = (-840, -40)
+    math_max1.location = (-630, 0)
+    math_max2.location = (-420, -40)
+    emission.location = (-210, -40)
+    transparent.location = (-210, 100)
+    mix.location = (0, 0)
+    group_output.location = (210, 0)
+    return node_group
+
+
+def get_texture_node(mat):
+    if mat is None or not mat.use_nodes:
+        return None
+    for node in mat.node_tree.nodes:
+        if node.type == 'TEX_IMAGE':
+            return node
+    return None
+
+
+def get_full_image(mat):
+    '''
+    get_full_image(Material mat) -> Image img
+
+        Returns the full resolution image of the layer material mat, also
+        when it shows a proxy.
+    '''
+
+    props = mat.get('2d_animation_tools')
+    if props is not None and props.get('full_image') is not None:
+        return props['full_image']
+    node = get_texture_node(mat)
+    return node.image if node is not None else None
+
+
+def show_resolution(mat, resolution):
+    '''
+    show_resolution(Material mat, string resolution) -> bool changed
+
+        Shows the image of resolution ('1', '2' or '4', see RESOLUTIONS)
+        in the layer material mat. Shows the full resolution image when
+        there is no such proxy. A proxy whose file changed since it was
+        loaded is reloaded. Returns if the image changed.
+    '''
+
+    node = get_texture_node(mat)
+    props = mat.get('2d_animation_tools')
+    if node is None or props is None or props.get('full_image') is None:
+        return False
+    img = props['full_image']
+    proxy_file = props.get('proxies', {}).get(resolution)
+    if proxy_file is not None:
+        proxy_path = bpy.path.abspath(proxy_file)
+        try:
+            img = bpy.data.images.load(proxy_path, check_existing=True)
+        except RuntimeError:
+            # Removed, the full resolution is better than nothing
+            pass
+        else:
+            if proxy_file.startswith('//'):
+                img.filepath = proxy_file
+            if img.get('2d_animation_tools') is None:
+                # Just loaded
+                store_image_file_stat(img, proxy_path)
+            elif image_file_changed(img, proxy_path):
+                # A sync wrote new proxies of a changed layer
+                img.reload()
+                store_image_file_stat(img, proxy_path)
+    if node.image == img:
+        return False
+    node.image = img
+    return True
+
+
+def get_proxy_materials():
+    for mat in bpy.data.materials:
+        props = mat.get('2d_animation_tools')
+        if props is not None and 'proxies' in props:
+            yield mat
+
+
+def set_layer_resolution(resolution):
+    '''
+    set_layer_resolution(string resolution) -> int changed
+
+        Shows the images of resolution in all layer materials with
+        proxies, now and after renders. Returns the number of materials
+        that changed.
+    '''
+
+    changed = 0
+    for mat in get_proxy_materials():
+        mat['2d_animation_tools']['resolution'] = resolution
+        changed += show_resolution(mat, resolution)
+    return changed
+
+
+@persistent
+def show_full_resolution(*args):
+    # Renders always use the full resolution images
+    for mat in get_proxy_materials():
+        show_resolution(mat, '1')
+
+
+@persistent
+def show_viewport_resolution(*args):
+    # After a render, back to the images that were shown before
+    for mat in get_proxy_materials():
+        show_resolution(mat, mat['2d_animation_tools'].get('resolution', '1'))
+
+
+class DataIndex:
+
+    '''
+    Index of the images and materials in bpy.data, so they don't have to
+    be searched for every layer. Images are keyed by their absolute file
+    path, materials by the image their image texture node uses. Packed
+    images the import creates are also kept by the hash of their pixels.
+    Create it once per import and add the data blocks the import creates.
+    '''
+
+    def __init__(self):
+        self.images = {}
+        self.materials = {}
+        self.content_images = {}
+        for img in bpy.data.images:
+            self.add_image(img)
+        for mat in bpy.data.materials:
+            if not mat.use_nodes:
+                continue
+            for node in mat.node_tree.nodes:
+                if node.type == 'TEX_IMAGE' and node.image is not None:
+                    # Not a proxy the material shows
+                    self.add_material(mat, get_full_image(mat))
+
+    @staticmethod
+    def image_key(filepath, library=None):
+        filepath = bpy.path.abspath(filepath, library=library)
+        return os.path.normcase(os.path.normpath(filepath))
+
+    def add_image(self, img):
+        if img.source != 'FILE' or not img.filepath:
+            return
+        key = self.image_key(img.filepath, library=img.library)
+        self.images.setdefault(key, img)
+
+    def find_image(self, img_path):
+        return self.images.get(self.image_key(img_path))
+
+    def add_material(self, mat, img):
+        self.materials.setdefault(img, []).append(mat)
+
+    def find_material(self, name, img):
+        for mat in self.materials.get(img, ()):
+            if name in mat.name:
+                return mat
+        return None
+
+    def add_content_image(self, content_hash, img):
+        self.content_images.setdefault(content_hash, img)
+
+    def find_content_image(self, content_hash):
+        return self.content_images.get(content_hash)
+
+
+class LayerStream:
+
+    '''
+    The exported images of a psd file whose layers are streamed: a layer
+    is only exported when its plane is about to be created, instead of
+    all layers up front. Use get() like the image_files dict of
+    parse_psd(), it exports layers until the one asked for is done and
+    fills in their bboxes along the way.
+    Call finish() once all planes are created, that saves the export
+    cache, or close() to stop.
+    '''
+
+    def __init__(self, steps, jobs, image_files, failed):
+        self.steps = steps
+        self.indices = set(i for i, png_file in jobs)
+        self.image_files = image_files
+        self.failed = failed
+        self.done = False
+
+    def next_step(self):
+        try:
+            next(self.steps)
+        except StopIteration:
+            self.done = True
+
+    def get(self, i, default=None):
+        if i in self.indices:
+            while not self.done and i not in self.image_files and i not in self.failed:
+                self.next_step()
+        return self.image_files.get(i, default)
+
+    def finish(self):
+        while not self.done:
+            self.next_step()
+
+    def close(self):
+        self.steps.close()
+        self.done = True
+
+
+class FrameSequence:
+
+    '''
+    The layers of psd files that are the frames of one animation, see
+    merge_frames(). frames has for the index of every merged layer a
+    list with per frame its (psd layer, crop bbox, image file), or None
+    when the frame doesn't have the layer or it wasn't exported.
+    '''
+
+    def __init__(self, frames, directory, frame_start):
+        self.frames = frames
+        self.directory = directory
+        self.frame_start = frame_start
+
+    def write_layer_frames(self, i, name, extension, save_options=None):
+        '''
+        write_layer_frames(int i, string name, string extension,
+                           dict save_options) -> string first_file
+
+            Links the images of layer i in a directory of their own as an
+            image sequence: frame_0001<extension>, frame_0002 ... Frames
+            without the layer get a transparent pixel. Identical frames
+            are links to the same file, copies where linking isn't
+            possible. Returns the file of the first frame.
+        '''
+
+        layer_dir = os.path.join(self.directory, '{}_{}'.format(name, i))
+        if not os.path.isdir(layer_dir):
+            os.makedirs(layer_dir)
+        empty_file = os.path.join(self.directory, 'empty' + extension)
+        frame_files = []
+        for n, frame in enumerate(self.frames[i]):
+            image_file = frame[2] if frame is not None else None
+            if image_file is None:
+                if not os.path.isfile(empty_file):
+                    layer_export.save_empty_image(empty_file, save_options)
+                image_file = empty_file
+            frame_file = os.path.join(layer_dir, 'frame_{:04d}{}'.format(n + 1, extension))
+            frame_files.append(frame_file)
+            if os.path.isfile(frame_file):
+                if os.path.samefile(image_file, frame_file):
+                    continue
+                os.remove(frame_file)
+            try:
+                os.link(image_file, frame_file)
+            except OSError:
+                shutil.copyfile(image_file, frame_file)
+        return frame_files[0]
+
+
+def get_layer_paths(layers):
+    '''
+    get_layer_paths(list layers) -> list paths
+
+        Returns the path of every layer in the group tree, the names of
+        its groups and its own name joined by '/'. Layers with the same
+        path get ' #2', ' #3' ... appended.
+    '''
+
+    paths = []
+    layer_paths = {}
+    counts = {}
+    for layer in layers:
+        parent_path = layer_paths.get(id(layer.parent))
+        path = layer.name if parent_path is None else '/'.join((parent_path, layer.name))
+        counts[path] = counts.get(path, 0) + 1
+        if counts[path] > 1:
+            path = '{} #{}'.format(path, counts[path])
+        layer_paths[id(layer)] = path
+        paths.append(path)
+    return paths
+
+
+def merge_frames(parsed_frames):
+    '''
+    merge_frames(list parsed_frames) -> list layers, list bboxes,
+                                        dict image_files, dict frames
+
+        Merges the layers of the parse_psd() results of the frames of a
+        sequence (None for a frame that failed) by their path in the group
+        tree. Returns one IndexedLayer per path, in stacking order, with
+        the bboxes and image files of the first frame that has it, for
+        create_objects(). frames is that of FrameSequence.
+    '''
+
+    # path -> (frame, layer index) where it is first seen
+    first_seen = {}
+    order = []
+    # Per frame: path -> layer index, id of a layer -> path
+    frame_indices = []
+    frame_paths = []
+    for f, parsed in enumerate(parsed_frames):
+        if parsed is None:
+            frame_indices.append({})
+            frame_paths.append({})
+            continue
+        paths = get_layer_paths(parsed[0])
+        frame_indices.append({path: i for i, path in enumerate(paths)})
+        frame_paths.append({id(layer): path for layer, path in zip(parsed[0], paths)})
+        for i, path in enumerate(paths):
+            if path in first_seen:
+                continue
+            first_seen[path] = (f, i)
+            # Right after the layer below it in this frame
+            position = order.index(paths[i - 1]) + 1 if i > 0 else 0
+            order.insert(position, path)
+    layers = []
+    bboxes = []
+    image_files = {}
+    frames = {}
+    # path -> merged layer
+    merged_layers = {}
+    for n, path in enumerate(order):
+        f, i = first_seen[path]
+        layer = parsed_frames[f][0][i]
+        frames[n] = []
+        visible = False
+        for g, indices in enumerate(frame_indices):
+            j = indices.get(path)
+            if j is None:
+                frames[n].append(None)
+                continue
+            frame_layers, frame_bboxes, frame_files = (parsed_frames[g][0], parsed_frames[g][1],
+                                                       parsed_frames[g][5])
+            image_file = frame_files.get(j) if frame_files is not None else None
+            frames[n].append((frame_layers[j], frame_bboxes[j], image_file))
+            visible = visible or frame_layers[j].visible
+            if n not in image_files and image_file is not None:
+                image_files[n] = image_file
+        # Groups come before their children, so the parent is merged
+        parent = merged_layers.get(frame_paths[f].get(id(layer.parent)))
+        merged = layer_index.IndexedLayer(layer.name, tuple(layer.bbox), layer.is_group(),
+                                          visible, parent)
+        merged_layers[path] = merged
+        layers.append(merged)
+        bboxes.append(parsed_frames[f][1][i])
+    return layers, bboxes, image_files, frames
+
+
+def get_file_stat(file_name):
+    '''
+    get_file_stat(string file_name) -> tuple stat
+
+        Returns the modification time and size of file_name, or None
+        when it doesn't exist (for example while it is being saved).
+    '''
+
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+def store_image_file_stat(img, img_path):
+    # Remember which version of the file is loaded, see image_file_changed()
+    try:
+        stat = os.stat(img_path)
+    except OSError:
+        return
+    img['2d_animation_tools'] = {'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+def image_file_changed(img, img_path):
+    '''
+    image_file_changed(Image img, string img_path) -> bool changed
+
+        Checks if img_path changed on disk since img was loaded from it.
+        Images not loaded by this add-on are always considered changed.
+    '''
+
+    props = img.get('2d_animation_tools')
+    try:
+        stat = os.stat(img_path)
+    except OSError:
+        return True
+    return (props is None or props.get('mtime') != stat.st_mtime or
+            props.get('size') != stat.st_size)
+
+
+def load_dependencies():
+    '''
+    load_dependencies() -> string error
+
+        Imports psd_tools, Pillow and numpy. Returns None when they are
+        there, else a message that tells which one is missing.
+    '''
+
+    global psd_tools, layer_export
+    try:
+        import psd_tools
+        from . import layer_export
+    except ImportError as err:
+        return ("Importing psd files needs psd-tools, Pillow and numpy in Blender's Python, "
+                "could not import {}".format(err.name or err))
+    return None
 
 
 def generate_random_id(length=8):
@@ -41,7 +533,21 @@ def generate_random_id(length=8):
     return ''.join(random.choice(chars) for _ in range(length))
 
 
+def get_python_executable():
+    # Before 2.91 sys.executable is the Blender binary itself
+    return getattr(bpy.app, 'binary_path_python', None) or sys.executable
+
+
+# Time of the last progress line, to not flood (slow) consoles
+_last_progress_print = 0
+
+
 def print_progress(progress, min=0, max=100, barlen=50, prefix='', suffix='', line_width=80):
+    global _last_progress_print
+    now = time.time()
+    if progress < max and now - _last_progress_print < PROGRESS_INTERVAL:
+        return
+    _last_progress_print = now
     total_len = max - min
     progress_float = (progress - min) / total_len
     bar_progress = int(progress_float * barlen) * '='
@@ -52,115 +558,412 @@ def print_progress(progress, min=0, max=100, barlen=50, prefix='', suffix='', li
     print(print_string, end='\r')
 
 
-def parse_psd(self, psd_file):
+def get_layer_key(i, layer_name):
+    '''
+    get_layer_key(int i, string layer_name) -> string key
+
+        Returns how the layer with index i shows up in import reports.
+    '''
+
+    return '{} {}'.format(i, layer_name)
+
+
+def get_save_options(self):
+    '''
+    get_save_options(class self) -> dict save_options
+
+        Returns the format options of the export for
+        layer_export.save_image().
+    '''
+
+    save_options = {'format': self.image_format}
+    if self.image_format == 'PNG':
+        save_options['compress_level'] = self.png_compression
+        save_options['palette'] = self.palette_png
+    return save_options
+
+
+def get_import_options(self):
     '''
-    parse_psd(string psd_file) -> list layers, list bboxes, tuple image_size, string png_dir
+    get_import_options(class self) -> dict options
+
+        Returns the settings of the import operator self, keyed by
+        property name, to store on the root empty of an import.
+    '''
+
+    options = {}
+    for name in ImportPsdAsPlanes.__annotations__:
+        value = getattr(self, name, None)
+        # Leaves out the selected files and how the import was started
+        if isinstance(value, (bool, int, float, str)) and name not in ('directory', 'invoked'):
+            options[name] = value
+    return options
+
+
+def parse_psd(self, psd_file, profile=None, unique_files=None, export_workers=None):
+    '''
+    parse_psd(string psd_file, ImportProfile profile, dict unique_files,
+              int export_workers)
+              -> list layers, list bboxes, tuple image_size, string png_dir,
+                 dict atlas_regions, dict image_files
 
         Reads psd_file and exports all layers to png's.
         Returns a list of all the layer objects, the image size and
         the png export directory.
+        The layer tree and the exports are saved in a layer index
+        (see layer_index.py). When psd_file and its exported images
+        didn't change since, the layers come from the index and psd_file
+        isn't opened at all.
+        image_files has the png with the pixels of every exported layer
+        index. When identical layers are shared that can be the png of
+        another layer, also one of another psd file.
+        When the images are packed nothing is exported, the bboxes
+        are all None and png_dir and image_files are None.
+        When the layers are streamed nothing is exported yet either,
+        image_files is a LayerStream that exports the layers when their
+        images are needed and fills in the bboxes.
+        With a texture atlas the exported png's are also packed on
+        atlases, atlas_regions has the region of every layer index on
+        them (see layer_export.build_atlases()). Else it is None.
+        This is a generator that yields the export progress (0 - 1),
+        use 'yield from' to get the result.
 
-        string psd_file - the filepath of the psd file
+        string psd_file   - the filepath of the psd file
+        ImportProfile profile - collects the time spent per stage
+        dict unique_files - pixel hash -> png file of the layers saved
+                            by this import, shared by all its psd files
+        int export_workers - processes of the parallel export instead of
+                             self.export_workers, 1 exports the layers
+                             in the calling thread
     '''
 
-    def get_layers(layer, all_layers=[]):
-        if not layer.is_group():
-            return
-        for sub_layer in reversed(layer):  # reversed() since psd_tools 1.8
-            all_layers.append(sub_layer)
-            get_layers(sub_layer, all_layers=all_layers)
-        return all_layers
+    def get_png_name(layer, i):
+        if self.clean_name:
+            name = bpy.path.clean_name(layer.name).rstrip('_')
+        else:
+            name = layer.name.replace('\x00', '')
+        name = name.rstrip('_')
+        if self.layer_index_name:
+            name = name + '_' + str(i)
+        return ''.join((name, layer_export.IMAGE_EXTENSIONS[self.image_format]))
 
-    def export_layers_as_png(layers, png_dir):
-        bboxes = []
+    def get_export_jobs(layers, png_dir):
+        jobs = []
         for i, layer in enumerate(layers):
             if (layer.is_group() or (not self.hidden_layers and not layer.is_visible())):
-                bboxes.append(None)
                 continue
-            prefix = '  - exporting: '
-            suffix = ' - {}'.format(layer.name)
-            print_progress(i+1, max=(len(layers)), barlen=40, prefix=prefix, suffix=suffix, line_width=120)
-            if self.clean_name:
-                name = bpy.path.clean_name(layer.name).rstrip('_')
-            else:
-                name = layer.name.replace('\x00', '')
-            name = name.rstrip('_')
-            if self.layer_index_name:
-                name = name + '_' + str(i)
-            png_file = os.path.join(png_dir, ''.join((name, '.png')))
+            jobs.append((i, os.path.join(png_dir, get_png_name(layer, i))))
+        return jobs
+
+    def export_layers_as_png(layers, jobs, png_dir, bboxes, image_files, pixel_hashes, failed):
+        if self.use_export_cache:
+            with profile.stage('cache_check'):
+                jobs, hashes = skip_cached_layers(layers, jobs, bboxes, image_files, pixel_hashes,
+                                                  png_dir)
+        profile.count('exported_layers', len(jobs))
+        parallel = self.parallel_export and workers != 1 and len(jobs) > 1
+        if streaming:
+            # Only the layers this process still exports need their data,
+            # the parallel export reads the psd file again
+            exported = set(i for i, png_file in jobs) if not parallel else ()
+            for i, layer in enumerate(layers):
+                if i not in exported:
+                    layer_export.release_layer_data(layer)
+        if parallel:
+            yield from export_layers_parallel(layers, jobs, bboxes, image_files, pixel_hashes, failed)
+        else:
+            yield from export_layers_serial(layers, jobs, bboxes, image_files, pixel_hashes, failed)
+        if self.use_export_cache:
+            # Layers that could not be exported don't go in the manifest
+            exported = [job for job in jobs if job[0] not in failed]
+            with profile.stage('cache_update'):
+                update_manifest(exported, hashes, bboxes, image_files, pixel_hashes, png_dir)
+        profile.count('failed_layers', len(failed))
+        profile.count('shared_layers', sum(1 for i, png_file in jobs
+                                           if image_files.get(i, png_file) != png_file))
+        if streaming:
+            with profile.stage('index_update'):
+                save_layer_index(png_dir, bboxes, image_files, pixel_hashes, failed)
+        # All pixels are exported, the psd file can be saved over again
+        layer_export.close_psd(psd)
+
+    def export_layers_serial(layers, jobs, bboxes, image_files, pixel_hashes, failed):
+        for done, (i, png_file) in enumerate(jobs):
+            layer = layers[i]
+            if not streaming:
+                prefix = '  - exporting: '
+                suffix = ' - {}'.format(layer.name)
+                print_progress(i+1, max=(len(layers)), barlen=40, prefix=prefix, suffix=suffix, line_width=120)
+            timings = {}
             try:
-                layer_image = layer.topil()
+                if unique_files is not None:
+                    bboxes[i], image_files[i], pixel_hashes[i] = layer_export.export_unique_layer(
+                        layer, png_file, self.crop_layers, unique_files, timings, save_options)
+                else:
+                    bboxes[i] = layer_export.export_layer(layer, png_file, self.crop_layers,
+                                                          timings, save_options)
+                    image_files[i] = png_file
             except ValueError:
                 print("Could not process layer " + layer.name)
-                bboxes.append(None)
-                continue
-            ## AUTOCROP
-            if self.crop_layers:
-                bbox = layer_image.getbbox()
-                bboxes.append(bbox)
-                layer_image = layer_image.crop(bbox)
+                failed.add(i)
+            for stage, seconds in timings.items():
+                profile.add_time(stage, seconds, get_layer_key(i, layer.name))
+            if streaming:
+                layer_export.release_layer_data(layer)
+            yield (done + 1) / len(jobs)
+
+    def get_export_settings():
+        return {'crop': self.crop_layers, 'save': save_options}
+
+    def get_index_settings():
+        # Everything that changes which layers are exported to what
+        return {'export': get_export_settings(),
+                'hidden_layers': self.hidden_layers,
+                'clean_name': self.clean_name,
+                'layer_index_name': self.layer_index_name,
+                'dedupe': self.dedupe_images,
+                'atlas': [self.atlas_size, self.atlas_padding] if self.use_atlas else None}
+
+    def load_indexed_psd(png_dir):
+        index = layer_index.load_index(png_dir, psd_file)
+        if index is None:
+            return None, None
+        exports = layer_index.indexed_exports(index, png_dir, get_index_settings())
+        if exports is None:
+            return None, index['psd']['hash']
+        layers, image_size = layer_index.indexed_layers(index)
+        bboxes, image_files, atlas_regions, pixel_hashes = exports
+        own_dir = os.path.normcase(os.path.normpath(png_dir))
+        if any(os.path.normcase(os.path.dirname(image_file)) != own_dir
+               for image_file in image_files.values()):
+            # Shares pngs of another psd file, those can change with it
+            return None, index['psd']['hash']
+        if unique_files is not None:
+            # Like skip_cached_layers(), so the next files can share them
+            for i, pixel_hash in pixel_hashes.items():
+                if i in image_files:
+                    unique_files.setdefault(pixel_hash, image_files[i])
+        profile.count('layers', len(layers))
+        profile.count('indexed_layers', len(layers))
+        return (layers, bboxes, image_size, png_dir, atlas_regions, image_files), None
+
+    def save_layer_index(png_dir, bboxes, image_files, pixel_hashes, failed, atlas_regions=None):
+        exports = None
+        if not failed:
+            # Failed layers are tried again next time
+            exports = layer_index.make_exports(png_dir, get_index_settings(), bboxes,
+                                               image_files, atlas_regions, pixel_hashes)
+        layer_index.save_index(png_dir, psd_file, image_size, layers, exports, psd_hash)
+
+    def skip_cached_layers(layers, jobs, bboxes, image_files, pixel_hashes, png_dir):
+        manifest = layer_export.load_manifest(png_dir)
+        settings = get_export_settings()
+        hashes = {}
+        export_jobs = []
+        cached = []
+        for i, png_file in jobs:
+            layer_hash = layer_export.layer_hash(layers[i])
+            entry = manifest.get(os.path.basename(png_file))
+            valid, bbox, image_file, pixel_hash = layer_export.cached_export(
+                entry, png_file, layer_hash, settings)
+            hashes[i] = layer_hash
+            if valid:
+                cached.append((i, png_file, bbox, image_file, pixel_hash))
             else:
-                bboxes.append(None)
-            layer_image.save(png_file)
-        return bboxes
+                export_jobs.append((i, png_file))
+        # A layer can share the png of a layer that changed, that png is
+        # about to be overwritten. The png of another psd file can change
+        # with a sync of that file.
+        overwritten = set(os.path.normcase(png_file) for i, png_file in export_jobs)
+        for i, png_file, bbox, image_file, pixel_hash in cached:
+            if (os.path.normcase(image_file) in overwritten or
+                    not layer_export.same_directory(image_file, png_file)):
+                export_jobs.append((i, png_file))
+                continue
+            bboxes[i] = bbox
+            image_files[i] = image_file
+            if pixel_hash is not None:
+                pixel_hashes[i] = pixel_hash
+            if unique_files is not None and pixel_hash is not None:
+                unique_files.setdefault(pixel_hash, image_file)
+        export_jobs.sort()
+        skipped = len(jobs) - len(export_jobs)
+        profile.count('cached_layers', skipped)
+        if skipped:
+            print('  - {} unchanged layers not exported again'.format(skipped))
+        return export_jobs, hashes
+
+    def update_manifest(exported_jobs, hashes, bboxes, image_files, pixel_hashes, png_dir):
+        if not exported_jobs:
+            return
+        manifest = layer_export.load_manifest(png_dir)
+        settings = get_export_settings()
+        for i, png_file in exported_jobs:
+            image_file = image_files.get(i)
+            if image_file is None or not os.path.isfile(image_file):
+                continue
+            manifest[os.path.basename(png_file)] = layer_export.manifest_entry(
+                png_file, hashes[i], settings, bboxes[i], image_file, pixel_hashes.get(i))
+        layer_export.save_manifest(png_dir, manifest)
 
+    def export_layers_parallel(layers, jobs, bboxes, image_files, pixel_hashes, failed):
+        memory_budget = 0
+        job_bytes = None
+        if streaming:
+            memory_budget = self.memory_budget * 1024 * 1024
+            job_bytes = [layer_export.layer_pixel_bytes(layers[i]) for i, png_file in jobs]
+        results = layer_export.export_layers_parallel(
+            psd_file, jobs, self.crop_layers, workers=workers,
+            executable=get_python_executable(), dedupe=unique_files is not None,
+            save_options=save_options, job_bytes=job_bytes,
+            memory_budget=memory_budget, release=streaming, fast_reader=self.fast_reader,
+            timeout=PROGRESS_INTERVAL)
+        png_files = dict(jobs)
+        done = 0
+        for item in results:
+            if item is None:
+                # Nothing done yet, let the UI respond in the meantime
+                yield done / len(jobs)
+                continue
+            i, result, timings = item
+            done += 1
+            if not streaming:
+                prefix = '  - exporting: '
+                suffix = ' - {}'.format(layers[i].name)
+                print_progress(done, max=(len(jobs)), barlen=40, prefix=prefix, suffix=suffix, line_width=120)
+            # Time spent in the worker processes, they overlap
+            for stage, seconds in timings.items():
+                profile.add_time(stage, seconds, get_layer_key(i, layers[i].name))
+            if isinstance(result, ValueError):
+                failed.add(i)
+                yield done / len(jobs)
+                continue
+            bbox, image_file, pixel_hash = result
+            if pixel_hash is not None:
+                shared_file = unique_files.setdefault(pixel_hash, image_file)
+                # Another worker saved the same pixels. The pngs of other
+                # psd files aren't shared, a sync of that file may rewrite them.
+                if shared_file != image_file and layer_export.same_directory(shared_file, image_file):
+                    if image_file == png_files[i]:
+                        os.remove(image_file)
+                    image_file = shared_file
+                pixel_hashes[i] = pixel_hash
+            bboxes[i] = bbox
+            image_files[i] = image_file
+            yield done / len(jobs)
+
+    def build_atlases(image_files, png_dir, psd_name):
+        # Identical layers share their region
+        unique_images = sorted(set(image_files.values()))
+        print('  - packing {} images on atlases'.format(len(unique_images)))
+        regions = layer_export.build_atlases(
+            unique_images, os.path.join(png_dir, '_'.join((psd_name, 'atlas'))),
+            self.atlas_size, self.atlas_padding, save_options)
+        regions = dict(zip(unique_images, regions))
+        return {i: regions[image_file] for i, image_file in image_files.items()}
+
+    if profile is None:
+        profile = import_profile.ImportProfile(psd_file)
+    if self.dedupe_images and unique_files is None:
+        unique_files = {}
+    elif not self.dedupe_images:
+        unique_files = None
+    save_options = get_save_options(self)
+    workers = self.export_workers if export_workers is None else export_workers
+    # The atlas and a sequence need all images at once
+    streaming = self.stream_layers and not self.use_atlas and not self.sequence
     print('parsing: {}'.format(psd_file))
-    psd_dir, psd_name = os.path.split(psd_file)
-    psd_name = os.path.splitext(psd_name)[0]
-    png_dir = os.path.join(psd_dir, '_'.join((psd_name, 'pngs')))
-    if not os.path.isdir(png_dir):
-        os.mkdir(png_dir)
-    psd = psd_tools.PSDImage.open(psd_file)
-
-    layers = get_layers(psd)
-    bboxes = export_layers_as_png(layers, png_dir)
+    # The layers of packed images are decoded when the images are
+    # created, so those always need the psd file
+    psd_hash = None
+    if not self.pack_images:
+        psd_dir, psd_name = os.path.split(psd_file)
+        psd_name = os.path.splitext(psd_name)[0]
+        png_dir = os.path.join(psd_dir, '_'.join((psd_name, 'pngs')))
+        if not os.path.isdir(png_dir):
+            os.mkdir(png_dir)
+        if self.use_export_cache:
+            with profile.stage('index_check'):
+                parsed, psd_hash = load_indexed_psd(png_dir)
+            if parsed is not None:
+                print('  - psd file not changed, using the layer index')
+                return parsed
+    with profile.stage('open_psd'):
+        psd = layer_export.open_psd(psd_file, self.fast_reader)
+        layers = layer_export.get_layers(psd)
+    profile.count('layers', len(layers))
     bb = psd.bbox
     image_size = (bb[2] - bb[0], bb[3] - bb[1])
+    atlas_regions = None
+    image_files = None
+    if self.pack_images:
+        png_dir = None
+        bboxes = [None] * len(layers)
+    else:
+        bboxes = [None] * len(layers)
+        image_files = {}
+        # Layer index -> pixel hash, known when identical layers are shared
+        pixel_hashes = {}
+        failed = set()
+        jobs = get_export_jobs(layers, png_dir)
+        steps = export_layers_as_png(layers, jobs, png_dir, bboxes, image_files, pixel_hashes,
+                                     failed)
+        if streaming:
+            image_files = LayerStream(steps, jobs, image_files, failed)
+        else:
+            yield from steps
+        if self.use_atlas:
+            with profile.stage('atlas'):
+                atlas_regions = build_atlases(image_files, png_dir, psd_name)
+        if not streaming:
+            with profile.stage('index_update'):
+                save_layer_index(png_dir, bboxes, image_files, pixel_hashes, failed, atlas_regions)
 
-    return (layers, bboxes, image_size, png_dir)
+    return (layers, bboxes, image_size, png_dir, atlas_regions, image_files)
 
 
-def create_objects(self, psd_layers, bboxes, image_size, img_dir, psd_name, import_id, collection):
+def create_objects(self, psd_layers, bboxes, image_size, img_dir, psd_file, import_id, collection, data_index, sync_root=None, atlas_regions=None, profile=None, image_files=None, sequence=None, psd_stat=None):
     '''
     create_objects(class self, list psd_layers, tuple image_size,
-                  string img_dir, string psd_name, list layers, string import_id)
+                  string img_dir, string psd_file, list layers, string import_id,
+                  DataIndex data_index, Object sync_root, dict atlas_regions,
+                  ImportProfile profile, dict image_files, FrameSequence sequence,
+                  tuple psd_stat)
 
         Imports all png images that are in psd_layers from img_dir
         into Blender as planes and places these planes correctly.
+        With sync_root the objects of that earlier import are updated
+        instead: only layers that changed are touched, objects are
+        added for new layers and removed for deleted ones.
+        This is a generator that yields the progress (0 - 1).
 
         class self        - the import operator class
         list psd_layers   - info about the layer like position and index
         list bboxes       - layers' bounding boxes if need to crop
         tuple image_size  - the width and height of the image
         string img_dir    - the path to the png images
-        string psd_name   - the name of the psd file
+        string psd_file   - the filepath of the psd file
         string import_id  - used to identify this import
+        DataIndex data_index - the images and materials that already exist
+        Object sync_root  - the root empty of the import to update
+        dict atlas_regions - where the layers are on the texture atlases,
+                             None when the layers have their own png
+        ImportProfile profile - collects the time spent per stage
+        dict image_files  - the png of every layer index (see parse_psd()),
+                            None uses the png named after the layer
+        FrameSequence sequence - the frames of every layer when psd_layers
+                                 are merged from a sequence of psd files.
+                                 The planes get image sequences and
+                                 keyframes that follow the layer.
+        tuple psd_stat    - the modification time and size of psd_file
+                            when it was parsed (see get_file_stat()),
+                            stored on the root empty for the watch mode
     '''
 
-    def get_parent(parent, import_id):
-        if parent.name == '_RootGroup':
-            return root_empty
-        if self.clean_name:
-            parent_name = bpy.path.clean_name(parent.name).rstrip('_')
-        else:
-            parent_name = parent.name.replace('\x00', '').rstrip('_')
-
-        if parent in psd_layers:
-            parent_index = psd_layers.index(parent)
-            for obj in bpy.context.scene.objects:
-                if (parent_name in obj.name and obj.type == 'EMPTY' and
-                        obj['2d_animation_tools']['import_id'] == import_id and
-                        obj['2d_animation_tools']['layer_index'] == str(parent_index)):
-                    return obj
-        else:
-            return root_empty
-
-    def group_object(obj, parent, import_id):
-        bpy.context.view_layer.update()
-        parent_empty = get_parent(parent, import_id)
-        matrix_parent_inverse = parent_empty.matrix_world.inverted()
-        obj.parent = parent_empty
-        obj.matrix_parent_inverse = matrix_parent_inverse
+    def get_parent(parent):
+        # Groups are created before their children, so the empty of
+        # the parent already exists. Top level layers go to the root.
+        return group_empties.get(parent, root_empty)
 
     def get_dimensions(layer, bbox):
         if self.crop_layers and bbox is not None:
@@ -194,54 +997,358 @@ def create_objects(self, psd_layers, bboxes, image_size, img_dir, psd_name, impo
         scale = Vector((scale_x, scale_y, scale_z))
         return (location, scale)
 
-    def get_children_median(obj):
-        children = [c for c in obj.children if c.type == 'MESH']
-        if not children:
+    def get_children_median(layer):
+        locations = child_locations.get(layer)
+        if not locations:
             return Vector()
-        child_locations = [c.matrix_world.to_translation() for c in children]
-        median = sum(child_locations, Vector()) / len(children)
-        return median
-
-    def move_to_children_median(obj):
-        median = get_children_median(obj)
-        obj.location = median
-        bpy.context.view_layer.update()
-        matrix_parent_inverse = obj.matrix_world.inverted()
-        # for c in [c for c in obj.children if c.type == 'MESH']:
-        for c in obj.children:
-            c.matrix_parent_inverse = matrix_parent_inverse
+        return sum(locations, Vector()) / len(locations)
+
+    def get_root_matrix(empty):
+        # Transform of empty relative to the root empty
+        if empty is root_empty:
+            return Matrix.Identity(4)
+        if empty in new_empty_matrices:
+            return new_empty_matrices[empty]
+        return root_inverse @ empty.matrix_world
+
+    def parent_objects():
+        # All new objects are still at their position relative to the root
+        # with an identity parent, so the transforms can be computed here
+        # instead of being read back from Blender after a view layer update
+        # for every object. A new group empty is placed at the median of
+        # its planes and the parent inverse of every new object cancels the
+        # transform of its parent relative to the root.
+        for layer, empty in group_empties.items():
+            if empty in new_objects:
+                empty.location = get_children_median(layer)
+                new_empty_matrices[empty] = Matrix.Translation(empty.location)
+        for obj, parent in parented_objects:
+            parent_empty = get_parent(parent)
+            obj.parent = parent_empty
+            obj.matrix_parent_inverse = get_root_matrix(parent_empty).inverted()
+
+    def reparent_objects():
+        # Existing objects that moved to another group in the psd. Their
+        # world transform stays the same.
+        for obj, parent in reparented_objects:
+            parent_empty = get_parent(parent)
+            old_parent_matrix = obj.parent.matrix_world @ obj.matrix_parent_inverse
+            new_parent_matrix = root_empty.matrix_world @ get_root_matrix(parent_empty)
+            obj.parent = parent_empty
+            obj.matrix_parent_inverse = new_parent_matrix.inverted() @ old_parent_matrix
+
+    def is_synced_object(obj, props):
+        # The files of a multi-file import share their import_id, the psd
+        # file stored on the object tells them apart, also when it was
+        # parented to a rig since
+        if 'psd_file' in props:
+            return os.path.normcase(os.path.abspath(props['psd_file'])) == psd_key
+        # Imported before the psd file was stored, go by the hierarchy
+        parent = obj.parent
+        while parent is not None:
+            if parent == root_empty:
+                return True
+            parent = parent.parent
+        return False
+
+    def is_import_parent(obj):
+        # Objects parented to something else since (a rig) stay there
+        props = obj.get('2d_animation_tools') if obj is not None else None
+        return props is not None and props.get('import_id') == import_id
+
+    def find_existing_objects():
+        # The objects of the import that is synced, by psd layer name
+        for obj in bpy.data.objects:
+            props = obj.get('2d_animation_tools')
+            if (obj == root_empty or props is None or
+                    props.get('import_id') != import_id or 'psd_layer_name' not in props or
+                    not is_synced_object(obj, props)):
+                continue
+            existing_objects.setdefault(props['psd_layer_name'], []).append(obj)
+
+    def match_existing(layer, layer_index, is_group):
+        # Prefer the object of the layer with the same name and index,
+        # else the layer moved in the stack and any with the same name
+        candidates = [obj for obj in existing_objects.get(layer.name, ())
+                      if obj not in matched_objects and (obj.type == 'EMPTY') == is_group]
+        if not candidates:
+            return None
+        for obj in candidates:
+            if obj['2d_animation_tools']['layer_index'] == layer_index:
+                break
+        else:
+            obj = candidates[0]
+        matched_objects.add(obj)
+        return obj
+
+    def remove_unmatched_objects():
+        # Objects of layers that don't exist (or aren't imported) anymore
+        for objects in existing_objects.values():
+            for obj in objects:
+                if obj not in matched_objects:
+                    bpy.data.objects.remove(obj)
+                    profile.count('objects_removed')
+
+    def store_layer_state(obj, layer_index, transforms, bbox, content_hash, shape):
+        # What a later sync needs to find out what changed
+        loc, scale = transforms
+        location = global_matrix @ loc
+        props = obj['2d_animation_tools']
+        props['layer_index'] = layer_index
+        props['psd_file'] = psd_file
+        if 'origin' not in props:
+            props['origin'] = list(location)
+        props['location'] = list(location)
+        props['size'] = [scale.x, scale.y]
+        if bbox is not None:
+            props['crop_bbox'] = list(bbox)
+        elif 'crop_bbox' in props:
+            del props['crop_bbox']
+        if content_hash is not None:
+            props['hash'] = content_hash
+        if shape is not None:
+            verts, faces = shape
+            props['shape'] = {'settings': [self.trim_vertices, self.trim_margin],
+                              'verts': [c for v in verts for c in v],
+                              'faces': [i for face in faces for i in face]}
+        elif 'shape' in props:
+            del props['shape']
+
+    def get_stored_shape(props):
+        # The trimmed mesh shape of an unchanged layer, if it was made
+        # with the current settings
+        stored = props.get('shape')
+        if stored is None or list(stored['settings']) != [self.trim_vertices, self.trim_margin]:
+            return None
+        verts = list(stored['verts'])
+        faces = list(stored['faces'])
+        return (list(zip(verts[0::2], verts[1::2])),
+                list(zip(faces[0::4], faces[1::4], faces[2::4], faces[3::4])))
+
+    def get_file_shape(img_path):
+        # Identical layers share their image file and its shape
+        if img_path not in file_shapes:
+            with profile.stage('trim'):
+                file_shapes[img_path] = layer_export.image_file_outline(
+                    img_path, self.trim_vertices, self.trim_margin)
+        return file_shapes[img_path]
+
+    def get_plane_image(plane):
+        mat = plane.active_material
+        if mat is None or not mat.use_nodes:
+            return None
+        return get_full_image(mat)
+
+    def get_own_plane_image(plane):
+        # The image of plane, unless planes of identical layers use it too
+        mat = plane.active_material
+        img = get_plane_image(plane)
+        if img is None or mat.users > 1 or img.users > 1:
+            return None
+        return img
+
+    def set_plane_image(plane, img, material_name):
+        mat = plane.active_material
+        if mat is None or not mat.use_nodes or get_plane_image(plane) == img:
+            return
+        if mat.users > 1:
+            # Shared with other planes, which keep their image
+            plane.active_material = create_cycles_material(material_name, img, import_id)
+            return
+        for node in mat.node_tree.nodes:
+            if node.type == 'TEX_IMAGE' and node.image != img:
+                node.image = img
+                data_index.add_material(mat, img)
+        props = mat.get('2d_animation_tools')
+        if props is not None and 'full_image' in props:
+            props['full_image'] = img
+
+    def get_proxy_files(img_path):
+        # Identical layers share their image file and its proxies
+        if img_path not in proxy_files:
+            with profile.stage('proxies'):
+                files = layer_export.write_proxies(bpy.path.abspath(img_path),
+                                                   save_options=get_save_options(self))
+            if rel_path:
+                files = {factor: bpy.path.relpath(proxy_file)
+                         for factor, proxy_file in files.items()}
+            proxy_files[img_path] = {str(factor): proxy_file
+                                     for factor, proxy_file in files.items()}
+        return proxy_files[img_path]
+
+    def set_plane_proxies(plane, img, files):
+        # The material shows the proxy of the resolution that was chosen
+        # for it, or the one of the import for a new material
+        mat = plane.active_material
+        props = mat.get('2d_animation_tools') if mat is not None else None
+        if props is None:
+            return
+        if files is None:
+            if 'proxies' in props:
+                show_resolution(mat, '1')
+                for key in ('full_image', 'proxies', 'resolution'):
+                    del props[key]
+            return
+        props['full_image'] = img
+        props['proxies'] = files
+        if 'resolution' not in props:
+            props['resolution'] = self.proxy_resolution
+        show_resolution(mat, props['resolution'])
+
+    def set_plane_uvs(plane, uvs):
+        # A shared mesh keeps the UVs of the whole image
+        if plane.data.users > 1:
+            return
+        uv_data = plane.data.uv_layers[0].data
+        old_uvs = [0.0] * len(uvs)
+        uv_data.foreach_get('uv', old_uvs)
+        if any(abs(old - new) > 1e-6 for old, new in zip(old_uvs, uvs)):
+            uv_data.foreach_set('uv', uvs)
+            plane.data.update()
+
+    def set_mesh_geometry(mesh, verts, faces, uvs, original_uvs=None):
+        # Replaces all geometry of a plane mesh, its material stays
+        mesh.clear_geometry()
+        mesh.from_pydata(verts, [], faces)
+        mesh.uv_layers.new().data.foreach_set('uv', uvs)
+        if original_uvs is not None:
+            mesh.uv_layers.new(name='Original').data.foreach_set('uv', original_uvs)
+        mesh.update()
+
+    def update_plane(plane, img, transforms, dimensions, uvs, material_name, shape=None):
+        # Only changes the image and geometry of the plane. The transforms
+        # of the object itself are kept, so animation and rigging survive.
+        set_plane_image(plane, img, material_name)
+        # A trimmed mesh (or one that isn't trimmed anymore) is rebuilt
+        reshape = plane.data.users == 1 and (shape is not None or len(plane.data.vertices) != 4)
+        if not reshape:
+            set_plane_uvs(plane, uvs)
+        props = plane['2d_animation_tools']
+        loc, scale = transforms
+        location = global_matrix @ loc
+        if 'location' in props:
+            old_location = Vector(props['location'])
+            origin = Vector(props['origin'])
+            old_size = tuple(props['size'])
+        else:
+            # Imported before the layer state was stored
+            old_location = origin = (root_inverse @ plane.matrix_world).to_translation()
+            old_size = None
+        if (not reshape and (location - old_location).length < 1e-6 and old_size is not None and
+                abs(old_size[0] - scale.x) < 1e-6 and abs(old_size[1] - scale.y) < 1e-6):
+            return
+        if plane.data.users > 1:
+            # Shared mesh, move and scale the object
+            parent_matrix = Matrix.Identity(4)
+            if plane.parent is not None:
+                parent_matrix = plane.parent.matrix_world @ plane.matrix_parent_inverse
+            to_basis = (root_inverse @ parent_matrix).to_3x3().inverted()
+            plane.location += to_basis @ (location - old_location)
+            plane_scale = global_matrix.to_3x3() @ Vector((scale.x, 1, scale.y))
+            plane.scale = [abs(s) for s in plane_scale]
+            props['origin'] = list(location)
+        elif reshape:
+            to_local = (root_inverse @ plane.matrix_world).to_3x3().inverted()
+            offset = location - origin
+            verts = [to_local @ (offset + v) for v in get_plane_verts(scale.x, scale.y, shape)]
+            original_uvs = None
+            if plane.data.uv_layers.get('Original') is not None:
+                original_uvs = get_shape_uvs(get_original_uvs(dimensions), shape)
+            faces = shape[1] if shape is not None else PLANE_FACES
+            set_mesh_geometry(plane.data, verts, faces, get_shape_uvs(uvs, shape), original_uvs)
+        else:
+            to_local = (root_inverse @ plane.matrix_world).to_3x3().inverted()
+            offset = location - origin
+            verts = [to_local @ (offset + v) for v in get_plane_verts(scale.x, scale.y)]
+            plane.data.vertices.foreach_set('co', [c for v in verts for c in v])
+            original_uvs = plane.data.uv_layers.get('Original')
+            if original_uvs is not None:
+                original_uvs.data.foreach_set('uv', get_original_uvs(dimensions))
+            plane.data.update()
 
     def create_image(img_path):
-        img_name = os.path.basename(img_path)
         # Check if image already exists
-        for i in bpy.data.images:
-            if img_name in i.name and (i.filepath == img_path or i.filepath == bpy.path.relpath(img_path)):
-                i.reload()
-                return i
+        img = data_index.find_image(img_path)
+        if img is not None:
+            if image_file_changed(img, img_path):
+                img.reload()
+                store_image_file_stat(img, img_path)
+                profile.count('images_reloaded')
+            return img
         # Image not found, create a new one
         try:
             img = bpy.data.images.load(img_path)
         except RuntimeError:
             return None
+        profile.count('images_loaded')
+        store_image_file_stat(img, img_path)
         if rel_path:
             img.filepath = bpy.path.relpath(img.filepath)
+        data_index.add_image(img)
         return img
 
+    def decode_packed_layer(layer):
+        try:
+            layer_image, bbox = layer_export.decode_layer(layer, self.crop_layers)
+        except ValueError:
+            print("Could not process layer " + layer.name)
+            return None, None
+        width, height = layer_image.size
+        if not width or not height:
+            return None, None
+        return layer_image, bbox
+
+    def create_packed_image(name, layer_image, img=None):
+        width, height = layer_image.size
+        if img is None:
+            img = bpy.data.images.new(name, width, height, alpha=True)
+        elif tuple(img.size) != (width, height):
+            img.scale(width, height)
+        img.pixels.foreach_set(layer_export.image_to_pixels(layer_image))
+        # Keep the pixels when the blend file is saved
+        img.pack()
+        return img
+
+    def create_group_material_nodes(mat, img):
+        node_tree = mat.node_tree
+        nodes = node_tree.nodes
+        # Create nodes
+        img_tex = nodes.new('ShaderNodeTexImage')
+        layer_shader = nodes.new('ShaderNodeGroup')
+        mat_output = nodes['Material Output']
+        # Set options
+        mat.blend_method = 'BLEND'
+        img_tex.image = img
+        img_tex.interpolation = self.texture_interpolation
+        img_tex.extension = 'CLIP' if self.clip else 'EXTEND'
+        layer_shader.node_tree = get_layer_shader_group()
+        # Connect nodes
+        node_tree.links.new(layer_shader.inputs[0], img_tex.outputs[0])
+        node_tree.links.new(layer_shader.inputs[1], img_tex.outputs[1])
+        node_tree.links.new(mat_output.inputs[0], layer_shader.outputs[0])
+        # Position nodes nicely
+        img_tex.location = (-420, 0)
+        layer_shader.location = (-120, 0)
+        mat_output.location = (120, 0)
+
     def create_cycles_material(name, img, import_id):
         interpolation = self.texture_interpolation
         # Check if material already exists
-        for m in bpy.data.materials:
-            if name in m.name and m.use_nodes:
-                for node in m.node_tree.nodes:
-                    if node.type == 'TEX_IMAGE' and node.image == img:
-                        return m
+        mat = data_index.find_material(name, img)
+        if mat is not None:
+            return mat
         mat = bpy.data.materials.new(name)
+        profile.count('materials_created')
+        data_index.add_material(mat, img)
         mat['2d_animation_tools'] = {'import_id': import_id}
         mat.use_nodes = True
         node_tree = mat.node_tree
         nodes = node_tree.nodes
         # Remove default Principled
         nodes.remove(nodes['Principled BSDF'])
+        if self.use_node_group:
+            create_group_material_nodes(mat, img)
+            return mat
         # Create nodes
         img_tex = nodes.new('ShaderNodeTexImage')
         light_path = nodes.new('ShaderNodeLightPath')
@@ -303,43 +1410,124 @@ def create_objects(self, psd_layers, bboxes, image_size, img_dir, psd_name, impo
 
         return mat
 
-    def create_textured_plane(name, transforms, global_matrix, import_id, layer_index, psd_layer_name, img_path, create_original_uvs, dimensions):
-        # Add UV's and add image to UV's
-        img = create_image(img_path)
-        if img is None:
-            return
+    def get_original_uvs(dimensions):
+        x, y, width, height = dimensions
+        u_min = x / image_width
+        u_max = (x+width) / image_width
+        v_min = (image_height-y-height) / image_height
+        v_max = (image_height-y) / image_height
+        return (u_min, v_min, u_max, v_min, u_max, v_max, u_min, v_max)
+
+    def get_atlas_uvs(region):
+        atlas_file, (atlas_width, atlas_height), (x, y, width, height) = region
+        u_min = x / atlas_width
+        u_max = (x+width) / atlas_width
+        v_min = (atlas_height-y-height) / atlas_height
+        v_max = (atlas_height-y) / atlas_height
+        return (u_min, v_min, u_max, v_min, u_max, v_max, u_min, v_max)
+
+    def get_plane_verts(half_width, half_height, shape=None):
         # Create plane with 'forward: -y' and 'up: z'
         # Then use axis conversion to change to orientation specified by user
-        loc, scale = transforms
-        verts = [(-scale.x, 0, scale.y),
-                 (scale.x, 0, scale.y),
-                 (scale.x, 0, -scale.y),
-                 (-scale.x, 0, -scale.y)]
-        verts = [global_matrix @ Vector(v) for v in verts]
-        faces = [(3, 2, 1, 0)]
+        if shape is not None:
+            # A trimmed mesh, see layer_export.alpha_outline()
+            verts = [((u * 2 - 1) * half_width, 0, (v * 2 - 1) * half_height)
+                     for u, v in shape[0]]
+        else:
+            verts = [(-half_width, 0, half_height),
+                     (half_width, 0, half_height),
+                     (half_width, 0, -half_height),
+                     (-half_width, 0, -half_height)]
+        return [global_matrix @ Vector(v) for v in verts]
+
+    def get_shape_uvs(uvs, shape):
+        # uvs are those of the corners of the plane, the trimmed mesh
+        # gets the UVs at the same place on the image
+        if shape is None:
+            return uvs
+        verts, faces = shape
+        u_min, v_min, u_max, v_max = uvs[0], uvs[1], uvs[4], uvs[5]
+        return [c for face in faces for i in face
+                for c in (u_min + verts[i][0] * (u_max - u_min),
+                          v_min + verts[i][1] * (v_max - v_min))]
+
+    def create_plane_mesh(name, half_width, half_height, original_uvs=None, uvs=PLANE_UVS, shape=None):
+        verts = get_plane_verts(half_width, half_height, shape)
+        faces = shape[1] if shape is not None else PLANE_FACES
         mesh = bpy.data.meshes.new(name)
         mesh.from_pydata(verts, [], faces)
-        plane = bpy.data.objects.new(name, mesh)
+        mesh.uv_layers.new().data.foreach_set('uv', get_shape_uvs(uvs, shape))
+        if original_uvs is not None:
+            mesh.uv_layers.new(name="Original").data.foreach_set(
+                'uv', get_shape_uvs(original_uvs, shape))
+        return mesh
+
+    def set_plane_frames(plane, i, i_offset):
+        # The image sequence starts at frame_start, the plane gets the
+        # size and position of the layer in every frame
+        frames = sequence.frames[i]
+        node = get_texture_node(plane.active_material)
+        if node is not None:
+            image_user = node.image_user
+            image_user.frame_duration = len(frames)
+            image_user.frame_start = sequence.frame_start
+            image_user.frame_offset = 0
+            image_user.use_auto_refresh = True
+        previous = None
+        for n, frame in enumerate(frames):
+            if frame is None or frame[2] is None:
+                # Shows a transparent pixel, wherever the plane is
+                continue
+            layer, bbox, image_file = frame
+            loc, scale = get_transforms(layer, bbox, i_offset)
+            location = global_matrix @ loc
+            plane_scale = global_matrix.to_3x3() @ Vector((scale.x, 1, scale.y))
+            plane_scale = Vector([abs(s) for s in plane_scale])
+            if previous is not None and previous == (location, plane_scale):
+                continue
+            previous = (location, plane_scale)
+            plane.location = location
+            plane.scale = plane_scale
+            plane.keyframe_insert('location', frame=sequence.frame_start + n)
+            plane.keyframe_insert('scale', frame=sequence.frame_start + n)
+        # Jump from frame to frame like the images do
+        if plane.animation_data is not None and plane.animation_data.action is not None:
+            for fcurve in plane.animation_data.action.fcurves:
+                for point in fcurve.keyframe_points:
+                    point.interpolation = 'CONSTANT'
+
+    def create_textured_plane(name, transforms, global_matrix, import_id, layer_index, psd_layer_name, img, create_original_uvs, dimensions, uvs=PLANE_UVS, material_name=None, shape=None):
+        loc, scale = transforms
+        layer_key = get_layer_key(layer_index, psd_layer_name)
+        with profile.stage('mesh', layer_key):
+            if shared_mesh is not None:
+                # Size the unit plane with the object scale instead
+                plane = bpy.data.objects.new(name, shared_mesh)
+                plane_scale = global_matrix.to_3x3() @ Vector((scale.x, 1, scale.y))
+                plane.scale = [abs(s) for s in plane_scale]
+            else:
+                original_uvs = None
+                if create_original_uvs:
+                    original_uvs = get_original_uvs(dimensions)
+                mesh = create_plane_mesh(name, scale.x, scale.y, original_uvs, uvs, shape)
+                plane = bpy.data.objects.new(name, mesh)
         plane.location = global_matrix @ loc
-        animation_tools_prop = {'import_id': import_id, 'layer_index': layer_index, 'psd_layer_name': psd_layer_name}
+        animation_tools_prop = {'import_id': import_id, 'layer_index': layer_index,
+                                'psd_layer_name': psd_layer_name, 'psd_file': psd_file}
         plane['2d_animation_tools'] = animation_tools_prop
-        plane.data.uv_layers.new()
-        if create_original_uvs:
-            x, y, width, height = dimensions
-            original_uvs = plane.data.uv_layers.new(name="Original")
-            original_uvs.data[0].uv = Vector((x / image_width,
-                                              (image_height-y-height) / image_height))
-            original_uvs.data[1].uv = Vector(((x+width) / image_width,
-                                              (image_height-y-height) / image_height))
-            original_uvs.data[2].uv = Vector(((x+width) / image_width,
-                                              (image_height-y) / image_height))
-            original_uvs.data[3].uv = Vector((x / image_width,
-                                              (image_height-y) / image_height))
-        # Create and assign material
-        mat = create_cycles_material(name, img, import_id)
-        plane.data.materials.append(mat)
+        # Create and assign material, planes on the same atlas share it
+        with profile.stage('material', layer_key):
+            mat = create_cycles_material(material_name or name, img, import_id)
+        if shared_mesh is not None:
+            # The mesh is shared, so the material goes on the object
+            plane.material_slots[0].link = 'OBJECT'
+            plane.material_slots[0].material = mat
+        else:
+            plane.data.materials.append(mat)
         return plane
 
+    if profile is None:
+        profile = import_profile.ImportProfile(psd_file)
     rel_path = self.rel_path
     group_empty = self.group_empty
     axis_forward = self.axis_forward
@@ -353,67 +1541,707 @@ def create_objects(self, psd_layers, bboxes, image_size, img_dir, psd_name, impo
                                     to_forward=axis_forward,
                                     to_up=axis_up).to_4x4()
 
-    root_name = os.path.splitext(psd_name)[0]
+    root_name = os.path.splitext(os.path.basename(psd_file))[0]
+    # To find the objects of psd_file, see is_synced_object()
+    psd_key = os.path.normcase(os.path.abspath(psd_file))
+
+    shared_mesh = None
+    # Planes of a sequence are sized per frame with their object scale
+    if sequence is not None or (self.shared_mesh and not self.create_original_uvs and
+                                sync_root is None and atlas_regions is None and
+                                not self.trim_meshes):
+        shared_mesh = create_plane_mesh(root_name, 1, 1)
+        shared_mesh.materials.append(None)
+
+    # Image file -> trimmed mesh shape
+    file_shapes = {}
+    # Image file -> its proxy files by resolution
+    proxy_files = {}
+    # Objects created by this import, removed again when it is cancelled
+    new_objects = set()
+    # Transforms relative to the root of the new group empties
+    new_empty_matrices = {}
+    # psd layer name -> objects of the synced import
+    existing_objects = {}
+    # Existing objects that are matched to a psd layer
+    matched_objects = set()
+    # (object, parent psd layer) of existing objects that changed group
+    reparented_objects = []
 
-    if group_empty:
+    if sync_root is not None:
+        root_empty = sync_root
+        with profile.stage('view_layer_update'):
+            bpy.context.view_layer.update()
+        root_inverse = root_empty.matrix_world.inverted()
+        find_existing_objects()
+    elif group_empty:
         root_empty = bpy.data.objects.new(root_name, None)
-        root_empty['2d_animation_tools'] = {'import_id': import_id, 'layer_index': 'root'}
+        root_empty['2d_animation_tools'] = {'import_id': import_id,
+                                            'layer_index': 'root',
+                                            'psd_file': psd_file}
         collection.objects.link(root_empty)
+        new_objects.add(root_empty)
+        root_inverse = Matrix.Identity(4)
     i_offset = 0
-    groups = []
-    for i, layer in enumerate(psd_layers):
-        prefix = '  - creating objects: '
-        suffix = ' - {}'.format(layer.name)
-        print_progress(i+1, max=(len(psd_layers)), barlen=40, prefix=prefix, suffix=suffix, line_width=120)
+    # psd layer -> empty created for it, to look up the parents
+    group_empties = {}
+    # (object, parent psd layer) of all objects to parent
+    parented_objects = []
+    # parent psd layer -> world locations of its planes
+    child_locations = {}
+    try:
+        for i, layer in enumerate(psd_layers):
+            yield i / len(psd_layers)
+            prefix = '  - creating objects: '
+            suffix = ' - {}'.format(layer.name)
+            print_progress(i+1, max=(len(psd_layers)), barlen=40, prefix=prefix, suffix=suffix, line_width=120)
 
-        if self.clean_name:
-            name = bpy.path.clean_name(layer.name).rstrip('_')
-        else:
-            name = layer.name.replace('\x00', '').rstrip('_')
-
-        psd_layer_name = layer.name
-        layer_index = str(i)
-        parent = layer.parent
-
-        if layer.is_group() and group_empty:
-            empty = bpy.data.objects.new(name, None)
-            animation_tools_prop = {'import_id': import_id,
-                                    'layer_index': layer_index,
-                                    'psd_layer_name': psd_layer_name}
-            empty['2d_animation_tools'] = animation_tools_prop
-            group_object(empty, parent, import_id)
-            groups.append(empty)
-            collection.objects.link(empty)
-        else:
-            bbox = bboxes[i]
-            transforms = get_transforms(layer, bbox, i_offset)
-            dimensions = get_dimensions(layer, bbox)
+            if self.clean_name:
+                name = bpy.path.clean_name(layer.name).rstrip('_')
+            else:
+                name = layer.name.replace('\x00', '').rstrip('_')
+
+            psd_layer_name = layer.name
+            layer_index = str(i)
+            layer_key = get_layer_key(i, psd_layer_name)
+            parent = layer.parent
+
+            if layer.is_group() and group_empty:
+                empty = None
+                if sync_root is not None:
+                    empty = match_existing(layer, layer_index, is_group=True)
+                if empty is not None:
+                    empty['2d_animation_tools']['layer_index'] = layer_index
+                    empty['2d_animation_tools']['psd_file'] = psd_file
+                    if empty.parent != get_parent(parent) and is_import_parent(empty.parent):
+                        reparented_objects.append((empty, parent))
+                else:
+                    empty = bpy.data.objects.new(name, None)
+                    animation_tools_prop = {'import_id': import_id,
+                                            'layer_index': layer_index,
+                                            'psd_layer_name': psd_layer_name,
+                                            'psd_file': psd_file}
+                    empty['2d_animation_tools'] = animation_tools_prop
+                    parented_objects.append((empty, parent))
+                    collection.objects.link(empty)
+                    new_objects.add(empty)
+                    profile.count('objects_created')
+                group_empties[layer] = empty
+                continue
+
+            if layer.is_group() or (not self.hidden_layers and not layer.is_visible()):
+                # Not exported
+                continue
+            plane = None
+            if sync_root is not None:
+                plane = match_existing(layer, layer_index, is_group=False)
             filename = name
             if self.layer_index_name:
                 filename += '_' + layer_index
-            img_path = os.path.join(img_dir, ''.join((filename, '.png')))
-            plane = create_textured_plane(name, transforms, global_matrix,
-                                          import_id, layer_index,
-                                          psd_layer_name, img_path,
-                                          self.create_original_uvs, dimensions)
-            if plane is None:
+            content_hash = None
+            uvs = PLANE_UVS
+            material_name = None
+            shape = None
+            files = None
+            if self.pack_images:
+                content_hash = '{}:{}'.format(layer_export.layer_hash(layer), self.crop_layers)
+                plane_props = plane['2d_animation_tools'] if plane is not None else {}
+                if self.trim_meshes:
+                    shape = get_stored_shape(plane_props)
+                if (plane_props.get('hash') == content_hash and
+                        (shape is not None or not self.trim_meshes)):
+                    # Unchanged, no need to decode the layer
+                    img = get_plane_image(plane)
+                    if self.stream_layers:
+                        layer_export.release_layer_data(layer)
+                    bbox = plane_props.get('crop_bbox')
+                    bbox = tuple(bbox) if bbox is not None else None
+                else:
+                    with profile.stage('decode', layer_key):
+                        layer_image, bbox = decode_packed_layer(layer)
+                    if self.stream_layers:
+                        layer_export.release_layer_data(layer)
+                    if layer_image is None:
+                        continue
+                    if self.trim_meshes:
+                        with profile.stage('trim', layer_key):
+                            shape = layer_export.image_outline(layer_image, self.trim_vertices,
+                                                               self.trim_margin)
+                    img = pixel_hash = None
+                    if self.dedupe_images:
+                        with profile.stage('hash', layer_key):
+                            pixel_hash = layer_export.pixel_hash(layer_image)
+                        img = data_index.find_content_image(pixel_hash)
+                    if img is None:
+                        with profile.stage('pack_image', layer_key):
+                            img = create_packed_image(filename, layer_image,
+                                                      get_own_plane_image(plane) if plane is not None else None)
+                        if pixel_hash is not None:
+                            data_index.add_content_image(pixel_hash, img)
+                    else:
+                        profile.count('shared_layers')
+                if self.dedupe_images:
+                    # Named after the first layer with these pixels
+                    material_name = img.name
+            elif atlas_regions is not None:
+                region = atlas_regions.get(i)
+                if region is None:
+                    continue
+                bbox = bboxes[i]
+                with profile.stage('load_image', layer_key):
+                    img = create_image(region[0])
+                uvs = get_atlas_uvs(region)
+                material_name = os.path.splitext(os.path.basename(region[0]))[0]
+                if self.trim_meshes:
+                    shape = get_file_shape(image_files[i])
+                if self.use_proxies and img is not None:
+                    files = get_proxy_files(region[0])
+            else:
+                if image_files is not None:
+                    # A LayerStream exports the layer here
+                    img_path = image_files.get(i)
+                    if img_path is None:
+                        # Could not be exported
+                        continue
+                    bbox = bboxes[i]
+                else:
+                    bbox = bboxes[i]
+                    img_path = os.path.join(img_dir, ''.join(
+                        (filename, layer_export.IMAGE_EXTENSIONS[self.image_format])))
+                if self.dedupe_images:
+                    material_name = os.path.splitext(os.path.basename(img_path))[0]
+                if sequence is not None:
+                    with profile.stage('sequence', layer_key):
+                        img_path = sequence.write_layer_frames(
+                            i, filename, os.path.splitext(img_path)[1], get_save_options(self))
+                    material_name = None
+                with profile.stage('load_image', layer_key):
+                    img = create_image(img_path)
+                if sequence is not None:
+                    if img is not None:
+                        img.source = 'SEQUENCE'
+                elif img is not None:
+                    if self.trim_meshes:
+                        shape = get_file_shape(img_path)
+                    if self.use_proxies:
+                        files = get_proxy_files(img_path)
+            if img is None:
                 continue
-            if group_empty:
-                group_object(plane, parent, import_id)
-            collection.objects.link(plane)
+            transforms = get_transforms(layer, bbox, i_offset)
+            dimensions = get_dimensions(layer, bbox)
+            if plane is not None:
+                with profile.stage('update_plane', layer_key):
+                    update_plane(plane, img, transforms, dimensions, uvs, material_name or name, shape)
+                profile.count('objects_updated')
+                if plane.parent != get_parent(parent) and is_import_parent(plane.parent):
+                    reparented_objects.append((plane, parent))
+            else:
+                plane = create_textured_plane(name, transforms, global_matrix,
+                                              import_id, layer_index,
+                                              psd_layer_name, img,
+                                              self.create_original_uvs, dimensions,
+                                              uvs, material_name, shape)
+                if plane is None:
+                    continue
+                if group_empty:
+                    parented_objects.append((plane, parent))
+                    child_locations.setdefault(parent, []).append(plane.location.copy())
+                with profile.stage('link', layer_key):
+                    collection.objects.link(plane)
+                new_objects.add(plane)
+                profile.count('objects_created')
+                if sequence is not None:
+                    with profile.stage('keyframes', layer_key):
+                        set_plane_frames(plane, i, i_offset)
+            if not self.pack_images:
+                set_plane_proxies(plane, img, files)
+            store_layer_state(plane, layer_index, transforms, bbox, content_hash, shape)
             i_offset += 1
+    except (GeneratorExit, Exception):
+        # Stopped early or failed, don't leave a half import behind
+        for obj in new_objects:
+            bpy.data.objects.remove(obj)
+        raise
 
-    if group_empty:
+    if group_empty and sequence is None:
+        # What the watch mode needs to import the file again, see PsdWatch
+        root_props = root_empty['2d_animation_tools']
+        root_props['options'] = get_import_options(self)
+        if psd_stat is not None:
+            # Sizes can be over the 32 bit limit of int properties
+            root_props['psd_mtime'], root_props['psd_size'] = psd_stat[0], float(psd_stat[1])
+
+    if sync_root is not None:
+        with profile.stage('parent'):
+            parent_objects()
+            reparent_objects()
+        with profile.stage('remove_objects'):
+            remove_unmatched_objects()
+        with profile.stage('view_layer_update'):
+            bpy.context.view_layer.update()
+    elif group_empty:
         # Position empty at median of children
-        groups.reverse()
-        for group in groups:
-            move_to_children_median(group)
+        with profile.stage('parent'):
+            parent_objects()
         # Select root empty and make active object
-        bpy.ops.object.select_all(action='DESELECT')
+        # No operator, so this also works without a UI context
+        for obj in bpy.context.view_layer.objects.selected:
+            obj.select_set(False)
         root_empty.select_set(True)
         bpy.context.view_layer.objects.active = root_empty
         # Move root empty to cursor position
         root_empty.location = bpy.context.scene.cursor.location
+        with profile.stage('view_layer_update'):
+            bpy.context.view_layer.update()
+
+
+def find_imported_root(scene, psd_file):
+    '''
+    find_imported_root(Scene scene, string psd_file) -> Object root_empty
+
+        Returns the root empty of an earlier import of psd_file in scene,
+        or None when it was not imported (with a root empty).
+    '''
+
+    psd_file = os.path.normcase(os.path.abspath(psd_file))
+    root_name = os.path.splitext(os.path.basename(psd_file))[0]
+    found = None
+    for obj in scene.objects:
+        props = obj.get('2d_animation_tools')
+        if obj.type != 'EMPTY' or props is None or props.get('layer_index') != 'root':
+            continue
+        if 'psd_file' in props:
+            if os.path.normcase(os.path.abspath(props['psd_file'])) == psd_file:
+                return obj
+        elif found is None and (obj.name == root_name or obj.name.startswith(root_name + '.')):
+            # Imported before the psd file was stored, go by name
+            found = obj
+    return found
+
+
+def scale_progress(steps, start, end):
+    '''
+    scale_progress(iterator steps, float start, float end) -> iterator
+
+        Runs the progress generator steps, yields its progress mapped
+        to the range start - end and returns the result of steps.
+    '''
+
+    try:
+        while True:
+            try:
+                progress = next(steps)
+            except StopIteration as stop:
+                return stop.value
+            yield start + progress * (end - start)
+    finally:
+        steps.close()
+
+
+def run_steps(steps):
+    '''
+    run_steps(iterator steps) -> result
+
+        Runs the progress generator steps to the end and returns its result.
+    '''
+
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
+
+
+def write_import_report(psd_file, profile, profiler=None):
+    '''
+    write_import_report(string psd_file, ImportProfile profile,
+                        cProfile.Profile profiler)
+
+        Saves the timings of the import of psd_file as a JSON report next
+        to its png directory and prints the stages. The statistics of
+        profiler, when given, are saved next to the report.
+    '''
+
+    report_file = import_profile.report_path(psd_file)
+    if profiler is not None:
+        profile.add_cprofile(profiler, import_profile.report_path(psd_file, '.prof'))
+    try:
+        profile.save(report_file)
+    except OSError as err:
+        print('  Could not write the import report: {}'.format(err))
+        return
+    print('  Import report: {}'.format(report_file))
+    print(profile.summary())
+
+
+def get_frame_key(psd_file):
+    # Sorts the files by name with the numbers in it as numbers
+    parts = re.split(r'(\d+)', os.path.basename(psd_file))
+    return [int(part) if part.isdecimal() else part.lower() for part in parts]
+
+
+def get_sequence_name(psd_files):
+    # What the file names have in common, without the frame numbers
+    names = [os.path.splitext(os.path.basename(psd_file))[0] for psd_file in psd_files]
+    return os.path.commonprefix(names).rstrip('0123456789_-. ') or names[0]
+
+
+def import_sequence(self, context, psd_files, profiles, import_id, data_index, unique_files,
+                    parse_workers=1):
+    '''
+    import_sequence(class self, Context context, list psd_files,
+                    list profiles, string import_id, DataIndex data_index,
+                    dict unique_files, int parse_workers) -> iterator
+
+        Imports psd_files as the frames of one animation, in the natural
+        order of their file names: numbers in the names are compared as
+        numbers, so frame_2 comes before frame_10. Every layer gets one plane, with an image sequence
+        of the layer in all frames and keyframes that follow its size
+        and position. Layers are matched by their path in the group tree
+        (see merge_frames()). Identical frames of a layer share a png
+        when self.dedupe_images is on.
+        This is a generator that yields the progress (0 - 1).
+
+        list profiles     - an ImportProfile per psd file
+        int parse_workers - number of files to parse at the same time,
+                            at least one per core
+    '''
+
+    if self.pack_images or self.use_atlas:
+        self.report({'ERROR'}, "A frame sequence can't use packed images or a texture atlas")
+        return
+    frames = sorted(zip(psd_files, profiles), key=lambda frame: get_frame_key(frame[0]))
+    psd_files = [psd_file for psd_file, profile in frames]
+    profiles = [profile for psd_file, profile in frames]
+    workers = max(parse_workers, min(len(psd_files), os.cpu_count() or 1))
+    # The threads split the processes of the parallel export, instead of
+    # every file starting as many. With one each a file is exported in
+    # its own thread.
+    export_workers = max(1, (self.export_workers or os.cpu_count() or 1) // workers)
+    parse_pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    parsed_files = []
+    try:
+        parsed_files = [parse_pool.submit(run_steps, parse_psd(self, psd_file, profile, unique_files,
+                                                               export_workers))
+                        for psd_file, profile in frames]
+        # Parsing is the first half of the progress
+        pending = parsed_files
+        while pending:
+            done, pending = concurrent.futures.wait(pending, timeout=PROGRESS_INTERVAL)
+            yield (len(parsed_files) - len(pending)) / len(parsed_files) / 2
+    finally:
+        # Only does something when the import was stopped early
+        for future in parsed_files:
+            future.cancel()
+        parse_pool.shutdown(wait=False)
+
+    parsed_frames = [future.result() for future in parsed_files]
+    for psd_file, parsed in zip(psd_files, parsed_frames):
+        if parsed is None:
+            msg = "Something went wrong. '{f}' is an empty frame!".format(f=os.path.basename(psd_file))
+            self.report({'WARNING'}, msg)
+            print("*** {}".format(msg))
+    first = next((f for f, parsed in enumerate(parsed_frames) if parsed is not None), None)
+    if first is None:
+        self.report({'ERROR'}, 'None of the frames could be imported')
+        return
+    layers, bboxes, image_files, layer_frames = merge_frames(parsed_frames)
+    print('sequence of {} frames, {} layers'.format(len(psd_files), len(layers)))
+    name = get_sequence_name(psd_files)
+    sequence = FrameSequence(layer_frames,
+                             os.path.join(os.path.dirname(psd_files[first]), name + '_sequence'),
+                             self.sequence_start)
+    collection = bpy.data.collections.new(name)
+    context.scene.collection.children.link(collection)
+    image_size, png_dir = parsed_frames[first][2:4]
+    steps = create_objects(self, layers, bboxes, image_size, png_dir, psd_files[first],
+                           import_id, collection, data_index, profile=profiles[first],
+                           image_files=image_files, sequence=sequence)
+    try:
+        yield from scale_progress(steps, 0.5, 1)
+    except (GeneratorExit, Exception):
+        # create_objects already removed the objects it created
+        bpy.data.collections.remove(collection)
+        raise
+    print(''.join(('  Done', 114 * ' ')))
+    for psd_file, profile in zip(psd_files, profiles):
+        profile.finish()
+        if self.write_report:
+            write_import_report(psd_file, profile)
+
+
+def import_files(self, context, parse_workers=1):
+    '''
+    import_files(class self, Context context, int parse_workers) -> iterator
+
+        Imports all files of the import operator self.
+        This is a generator that yields the progress of the whole
+        import (0 - 1). When it is closed before it is done, the objects
+        of the file that was being imported are removed again.
+
+        class self        - the import operator class (or an object with
+                            the same properties)
+        int parse_workers - number of files to parse at the same time.
+                            Parsing happens in threads, the objects are
+                            always created from the calling thread.
+    '''
+
+    error = load_dependencies()
+    if error is not None:
+        self.report({'ERROR'}, error)
+        return
+    if (self.image_format == 'WEBP' and not self.pack_images and
+            bpy.app.version < (3, 4, 0)):
+        self.report({'ERROR'}, 'WebP images need Blender 3.4 or newer')
+        return
+
+    start_time = time.time()
+    print()
+
+    d = self.properties.directory
+    files = self.properties.files
+    random.seed()
+    import_id = generate_random_id()
+    data_index = DataIndex()
+    profiles = [import_profile.ImportProfile(os.path.join(d, f.name)) for f in files]
+    # Pixel hash -> png file, so identical layers of all files share a png
+    unique_files = {} if self.dedupe_images else None
+
+    if self.sequence and len(files) > 1:
+        yield from import_sequence(self, context, [os.path.join(d, f.name) for f in files],
+                                   profiles, import_id, data_index, unique_files, parse_workers)
+        print('\nSequence imported in {s:.2f} seconds'.format(s=time.time() - start_time))
+        return
+
+    # The version of the files that is imported, taken before parsing
+    psd_stats = [get_file_stat(os.path.join(d, f.name)) for f in files]
+
+    parse_pool = None
+    if parse_workers > 1 and len(files) > 1:
+        parse_pool = concurrent.futures.ThreadPoolExecutor(max_workers=parse_workers)
+        parsed_files = [parse_pool.submit(run_steps, parse_psd(self, os.path.join(d, f.name), profile, unique_files))
+                        for f, profile in zip(files, profiles)]
+
+    try:
+        for i, f in enumerate(files):
+            psd_name = os.path.basename(f.name)
+            psd_file = os.path.join(d, f.name)
+            sync_root = None
+            if self.sync and self.group_empty:
+                sync_root = find_imported_root(context.scene, psd_file)
+            if sync_root is not None:
+                file_import_id = sync_root['2d_animation_tools']['import_id']
+                collection = sync_root.users_collection[0]
+            else:
+                file_import_id = import_id
+                collection_name = os.path.splitext(psd_name)[0]
+                collection = bpy.data.collections.new(collection_name)
+                context.scene.collection.children.link(collection)
+
+            # Parsing is the first half of the progress of a file,
+            # creating the objects the second half
+            file_start = i / len(files)
+            file_middle = (i + 0.5) / len(files)
+            file_end = (i + 1) / len(files)
+            profile = profiles[i]
+            # Parsing in the threads of parse_pool is not profiled
+            profiler = cProfile.Profile() if self.use_cprofile else None
+            image_files = None
+            try:
+                try:
+                    if parse_pool is not None:
+                        future = parsed_files[i]
+                        while not future.done():
+                            concurrent.futures.wait([future], timeout=PROGRESS_INTERVAL)
+                            yield file_start
+                        psd_layers, bboxes, image_size, png_dir, atlas_regions, image_files = future.result()
+                    else:
+                        steps = parse_psd(self, psd_file, profile, unique_files)
+                        if profiler is not None:
+                            steps = import_profile.profiled_steps(steps, profiler)
+                        psd_layers, bboxes, image_size, png_dir, atlas_regions, image_files = yield from scale_progress(
+                            steps, file_start, file_middle)
+                except TypeError:   # None is returned, so something went wrong.
+                    msg = "Something went wrong. '{f}' is not imported!".format(f=psd_name)
+                    self.report({'ERROR'}, msg)
+                    print("*** {}".format(msg))
+                    continue
+                steps = create_objects(self, psd_layers, bboxes, image_size,
+                                       png_dir, psd_file, file_import_id, collection,
+                                       data_index, sync_root=sync_root,
+                                       atlas_regions=atlas_regions, profile=profile,
+                                       image_files=image_files, psd_stat=psd_stats[i])
+                if profiler is not None:
+                    steps = import_profile.profiled_steps(steps, profiler)
+                yield from scale_progress(steps, file_middle, file_end)
+                if isinstance(image_files, LayerStream):
+                    # Layers no plane asked for and the export cache
+                    image_files.finish()
+            except (GeneratorExit, Exception):
+                if isinstance(image_files, LayerStream):
+                    image_files.close()
+                # create_objects already removed the objects it created
+                if sync_root is None:
+                    bpy.data.collections.remove(collection)
+                raise
+            print(''.join(('  Done', 114 * ' ')))
+            profile.finish()
+            if self.write_report or profiler is not None:
+                write_import_report(psd_file, profile, profiler)
+    finally:
+        if parse_pool is not None:
+            # Only does something when the import was stopped early
+            for future in parsed_files:
+                future.cancel()
+            parse_pool.shutdown(wait=False)
+
+    if len(files) > 1:
+        print_f = 'Files'
+    else:
+        print_f = 'File'
+    print('\n{print_f} imported in {s:.2f} seconds'.format(
+        print_f=print_f, s=time.time() - start_time))
+
+
+class WatchedFile:
+
+    '''
+    A psd file the watch mode checks: the version of the file its root
+    empty stores, the version that is imported (or failed to import) and
+    the version that was seen last, since when.
+    '''
+
+    def __init__(self, stored):
+        self.stored = stored
+        self.imported = stored
+        self.seen = stored
+        self.seen_since = 0
+
+
+class PsdWatch:
+
+    '''
+    Watches the psd files imported into the scene and imports them again
+    with sync when they were saved, once they stay the same for debounce
+    seconds. The files are found by the root empties of their imports
+    (those that stored their import options), which are only looked up
+    again when the number of objects or the scene changes. So while
+    nothing changes a check is just a stat of every watched file.
+    '''
+
+    def __init__(self, interval=WATCH_INTERVAL, debounce=WATCH_DEBOUNCE):
+        self.interval = interval
+        self.debounce = debounce
+        # psd file -> WatchedFile
+        self.files = {}
+        self.scan_key = None
+
+    def scan(self, scene):
+        files = {}
+        for obj in scene.objects:
+            props = obj.get('2d_animation_tools')
+            if (obj.type != 'EMPTY' or props is None or props.get('layer_index') != 'root' or
+                    'options' not in props):
+                continue
+            psd_file = os.path.abspath(props['psd_file'])
+            stored = None
+            if 'psd_mtime' in props:
+                stored = props['psd_mtime'], int(props['psd_size'])
+            watched = self.files.get(psd_file)
+            if watched is None or watched.stored != stored:
+                watched = WatchedFile(stored)
+            files[psd_file] = watched
+        self.files = files
+
+    def check(self):
+        # The timer function, returns the time until the next check
+        context = bpy.context
+        scene = context.scene
+        if scene is None:
+            return self.interval
+        scan_key = (scene.name, len(bpy.data.objects))
+        if scan_key != self.scan_key:
+            self.scan(scene)
+            self.scan_key = scan_key
+        now = time.time()
+        for psd_file, watched in self.files.items():
+            stat = get_file_stat(psd_file)
+            if stat is None or stat == watched.imported:
+                # Being saved, or saved back to the imported version
+                watched.seen = watched.imported
+                continue
+            if stat != watched.seen:
+                watched.seen = stat
+                watched.seen_since = now
+            elif now - watched.seen_since >= self.debounce and context.mode == 'OBJECT':
+                # Also when the import fails, so it's only tried again
+                # when the file is saved again
+                watched.imported = stat
+                self.reimport(context, psd_file, scene)
+                # Objects are looked up again, a sync may not change the count
+                self.scan_key = None
+                break
+        return self.interval
+
+    def reimport(self, context, psd_file, scene):
+        from . import batch_import
+        root = find_imported_root(scene, psd_file)
+        if root is None:
+            return
+        defaults = batch_import.get_default_options()
+        options = {name: type(defaults[name])(value)
+                   for name, value in root['2d_animation_tools']['options'].items()
+                   if name in defaults}
+        # Only the layers that changed are exported and reloaded. The sync
+        # only touches the objects that store this psd file, wherever they
+        # are parented, also when the file was imported together with
+        # others (that share its import_id).
+        options.update(sync=True, group_empty=True, use_export_cache=True,
+                       responsive=False, use_cprofile=False)
+        print("\nReimporting '{}', it changed on disk".format(os.path.basename(psd_file)))
+        try:
+            run_steps(import_files(batch_import.ImportOptions([psd_file], **options), context))
+        except Exception:
+            # An exception would stop the timer
+            traceback.print_exc()
+
+
+# The running watch, see start_watch()
+_watch = None
+
+
+def start_watch(interval=WATCH_INTERVAL, debounce=WATCH_DEBOUNCE):
+    '''
+    start_watch(float interval, float debounce)
+
+        Checks the imported psd files every interval seconds from now on
+        and imports them again when they changed, see PsdWatch.
+    '''
+
+    global _watch
+    stop_watch()
+    _watch = PsdWatch(interval, debounce)
+    # Keeps running when another blend file is opened
+    bpy.app.timers.register(_watch.check, first_interval=interval, persistent=True)
+
+
+def stop_watch():
+    global _watch
+    if _watch is not None and bpy.app.timers.is_registered(_watch.check):
+        bpy.app.timers.unregister(_watch.check)
+    _watch = None
+
+
+def is_watching():
+    return _watch is not None
+
+
+@persistent
+def rescan_watch(*args):
+    # After opening a blend file, look up the imports of the new scene
+    if _watch is not None:
+        _watch.files = {}
+        _watch.scan_key = None
 
 
 # Actual import operator.
@@ -434,9 +2262,12 @@ class ImportPsdAsPlanes(bpy.types.Operator, ImportHelper):
     files: CollectionProperty(
         type=bpy.types.OperatorFileListElement,
         options={'HIDDEN', 'SKIP_SAVE'})
+    # Set by invoke(), only imports started from the UI are responsive
+    invoked: BoolProperty(
+        options={'HIDDEN', 'SKIP_SAVE'})
 
     filename_ext = '.psd'
-    filter_glob: StringProperty(default='*.psd', options={'HIDDEN'})
+    filter_glob: StringProperty(default='*.psd;*.psb', options={'HIDDEN'})
     offset: FloatProperty(
         name='Offset',
         description='Offset planes by this amount on the Y axis',
@@ -449,6 +2280,40 @@ class ImportPsdAsPlanes(bpy.types.Operator, ImportHelper):
         name='Create original UVS',
         description='Generate an additional UV layer for placing the uncropped image',
         default=False)
+    shared_mesh: BoolProperty(
+        name='Shared mesh',
+        description='Use one mesh for all planes and size the planes with the object scale. '
+                    'Not possible with original UVs, a texture atlas or trimmed meshes',
+        default=False)
+    trim_meshes: BoolProperty(
+        name='Trim meshes',
+        description='Give every plane a mesh that follows the outline of its layer instead of '
+                    'a rectangle, so the transparent parts cost less to render',
+        default=False)
+    trim_vertices: IntProperty(
+        name='Vertices',
+        description='Maximum number of vertices of a trimmed mesh',
+        default=16,
+        min=4,
+        max=256)
+    trim_margin: IntProperty(
+        name='Margin',
+        description='Pixels the trimmed mesh keeps around the layer, so texture filtering '
+                    'at its edges is not cut off',
+        default=2,
+        min=0,
+        max=64)
+    sequence: BoolProperty(
+        name='Frame sequence',
+        description='Import the files as the frames of one animation, in the order of their '
+                    'names (frame_2 before frame_10). Layers with the same path in the group tree get one plane with an '
+                    'image sequence. Not possible with packed images or a texture atlas, '
+                    'trimmed meshes and proxies are not used',
+        default=False)
+    sequence_start: IntProperty(
+        name='Start frame',
+        description='Frame of the first file of the sequence',
+        default=1)
     hidden_layers: BoolProperty(
         name='Import hidden layers',
         description='Also import hidden layers',
@@ -482,6 +2347,11 @@ class ImportPsdAsPlanes(bpy.types.Operator, ImportHelper):
         name='Clip texture',
         description='Use CLIP as image extension. Avoids fringes on the edges',
         default=True)
+    use_node_group: BoolProperty(
+        name='Shared shader',
+        description='Put the shader in a node group all layer materials share. '
+                    'Faster to import and to compile',
+        default=False)
     texture_interpolation: EnumProperty(
         name='Interpolation',
         description='Texture Interpolation',
@@ -502,6 +2372,122 @@ class ImportPsdAsPlanes(bpy.types.Operator, ImportHelper):
         name='Layer Index',
         description='Add layer index to the png name. If not, possible conflicts may arise',
         default=True)
+    parallel_export: BoolProperty(
+        name='Parallel export',
+        description='Export the layers with multiple processes. '
+                    'Every process reads the whole psd file, so this uses more memory',
+        default=False)
+    export_workers: IntProperty(
+        name='Processes',
+        description='Number of processes used for the export, 0 uses all cores',
+        default=0,
+        min=0)
+    fast_reader: BoolProperty(
+        name='Fast reader',
+        description='Read the psd file with the built-in reader, which only reads the pixels '
+                    'of a layer when it is exported. psd-tools reads the files it does not '
+                    'support (other color modes than RGB, 32 bit and artboards)',
+        default=True)
+    stream_layers: BoolProperty(
+        name='Stream layers',
+        description="Export every layer just before its plane is created instead of all "
+                    "layers first, and free the layer's data once it is done. Uses less memory "
+                    "on large psd files. Not used with a texture atlas",
+        default=False)
+    memory_budget: IntProperty(
+        name='Memory budget',
+        description='Maximum memory (in MB) for the pixels of the layers that are exported '
+                    'at the same time by a parallel streamed export. A single layer is always '
+                    'exported, even when it needs more',
+        default=1024,
+        min=64)
+    use_proxies: BoolProperty(
+        name='Proxy images',
+        description='Also save the layers at a half and a quarter of their size and show those '
+                    'in the viewport. Renders always use the full resolution. Not for packed images',
+        default=False)
+    proxy_resolution: EnumProperty(
+        name='Viewport',
+        description='Resolution of the images in the viewport, switch it later with '
+                    'View > PSD Layer Resolution',
+        items=RESOLUTIONS,
+        default='2')
+    pack_images: BoolProperty(
+        name='Pack images',
+        description="Don't export png's, put the pixels of the layers directly in packed images",
+        default=False)
+    responsive: BoolProperty(
+        name='Responsive import',
+        description='Import in small steps, so Blender stays responsive. Press Esc to cancel. '
+                    'Only when the import is started from the menu, scripts always get the '
+                    'result right away',
+        default=True)
+    sync: BoolProperty(
+        name='Update existing',
+        description='Update an earlier import of the psd file in place instead of importing it again. '
+                    'Only the layers that changed are updated, objects of new and deleted layers '
+                    'are added and removed',
+        default=False)
+    use_export_cache: BoolProperty(
+        name='Reuse exported layers',
+        description='Only export layers that changed since the last import of the psd file, '
+                    'going by the manifest in the png directory. Disable it (or delete the png '
+                    'directory) to export all layers again',
+        default=False)
+    image_format: EnumProperty(
+        name='Format',
+        description='File format of the exported layers, all are lossless',
+        items=(('PNG', 'PNG', 'Compressed, small files'),
+               ('TARGA', 'Targa', 'Uncompressed, the fastest to write and to load, but large files'),
+               ('WEBP', 'WebP', 'Smaller than png, but slower to write. Needs Blender 3.4 or newer')),
+        default='PNG')
+    png_compression: IntProperty(
+        name='Compression',
+        description='Zlib compression level of the png files. 0 and 1 are much faster to export, '
+                    'but the files are larger',
+        default=6,
+        min=0,
+        max=9)
+    palette_png: BoolProperty(
+        name='Palette for few colors',
+        description='Save layers with at most 256 colors as palette png files, '
+                    'which are a lot smaller',
+        default=False)
+    dedupe_images: BoolProperty(
+        name='Share identical layers',
+        description='Save layers with identical pixels only once and let them share one image '
+                    'and material. Between the psd files of one import the pngs are linked, '
+                    'every psd file keeps its own images',
+        default=False)
+    use_atlas: BoolProperty(
+        name='Texture atlas',
+        description='Also pack the exported layers on one or a few large images, '
+                    'so all planes of a psd file share a single material',
+        default=False)
+    atlas_size: IntProperty(
+        name='Atlas size',
+        description='Maximum width and height of an atlas in pixels. '
+                    'Layers that are larger get an atlas of their own',
+        default=4096,
+        min=256,
+        max=16384)
+    atlas_padding: IntProperty(
+        name='Padding',
+        description='Empty pixels around every layer on the atlas, '
+                    'keeps neighbouring layers from bleeding in',
+        default=2,
+        min=0,
+        max=64)
+    write_report: BoolProperty(
+        name='Timing report',
+        description='Write the time spent per import stage and per layer to a JSON file '
+                    'next to the png directory',
+        default=False)
+    use_cprofile: BoolProperty(
+        name='Profile',
+        description='Also profile the import with cProfile and save the statistics '
+                    'next to the timing report. Makes the import slower',
+        default=False)
 
     @classmethod
     def poll(self, context):
@@ -533,60 +2519,190 @@ class ImportPsdAsPlanes(bpy.types.Operator, ImportHelper):
         sub_col.prop(self, 'crop_layers', toggle=True)
         if self.crop_layers:
             sub_col.prop(self, 'create_original_uvs', toggle=True)
+        row = sub_col.row(align=True)
+        row.active = (not self.create_original_uvs and not self.trim_meshes and
+                      not (self.use_atlas and not self.pack_images))
+        row.prop(self, 'shared_mesh', toggle=True)
+        sub_col = col.column(align=True)
+        sub_col.prop(self, 'trim_meshes', toggle=True)
+        if self.trim_meshes:
+            sub_col.prop(self, 'trim_vertices')
+            sub_col.prop(self, 'trim_margin')
         # Grouping options
         box = layout.box()
         box.label(text='Grouping', icon='GROUP')
         row = box.row(align=True)
         row.prop(self, 'group_empty', toggle=True)
+        row = box.row(align=True)
+        row.active = self.group_empty and not self.sequence
+        row.prop(self, 'sync', toggle=True)
+        sub_col = box.column(align=True)
+        sub_col.prop(self, 'sequence', toggle=True)
+        if self.sequence:
+            sub_col.prop(self, 'sequence_start')
         # Material options (not much for now)
         box = layout.box()
         box.label(text='Material options', icon='MATERIAL_DATA')
         col = box.column()
         col.prop(self, 'texture_interpolation')
         col.prop(self, 'clip', toggle=True)
+        col.prop(self, 'use_node_group', toggle=True)
         # Import options
         box = layout.box()
         box.label(text='Import options', icon='FILTER')
         col = box.column()
-        col.prop(self, 'rel_path')
         col.prop(self, 'clean_name')
         col.prop(self, 'hidden_layers', icon='GHOST_ENABLED')
         col.prop(self, 'layer_index_name')
+        col.separator()
+        col.prop(self, 'fast_reader')
+        col.prop(self, 'pack_images')
+        col.prop(self, 'dedupe_images')
+        row = col.row()
+        row.active = self.pack_images or not self.use_atlas
+        row.prop(self, 'stream_layers')
+        # Png export options
+        col = col.column()
+        col.active = not self.pack_images
+        col.prop(self, 'rel_path')
+        col.prop(self, 'image_format')
+        if self.image_format == 'PNG':
+            sub_col = col.column(align=True)
+            sub_col.prop(self, 'png_compression')
+            sub_col.prop(self, 'palette_png', toggle=True)
+        col.prop(self, 'use_export_cache')
+        sub_col = col.column(align=True)
+        sub_col.prop(self, 'use_proxies', toggle=True)
+        if self.use_proxies:
+            sub_col.prop(self, 'proxy_resolution')
+        sub_col = col.column(align=True)
+        sub_col.prop(self, 'use_atlas', toggle=True)
+        if self.use_atlas:
+            sub_col.prop(self, 'atlas_size')
+            sub_col.prop(self, 'atlas_padding')
+        sub_col = col.column(align=True)
+        sub_col.prop(self, 'parallel_export', toggle=True)
+        if self.parallel_export:
+            sub_col.prop(self, 'export_workers')
+            if self.stream_layers and not self.use_atlas:
+                sub_col.prop(self, 'memory_budget')
+        box.prop(self, 'responsive')
+        row = box.row(align=True)
+        row.prop(self, 'write_report', toggle=True)
+        row.prop(self, 'use_cprofile', toggle=True)
+
+    def invoke(self, context, event):
+        self.invoked = True
+        return ImportHelper.invoke(self, context, event)
 
     def execute(self, context):
+        error = load_dependencies()
+        if error is not None:
+            self.report({'ERROR'}, error)
+            return {'CANCELLED'}
         if context.active_object and context.active_object.mode == 'EDIT':
             bpy.ops.object.mode_set(mode='OBJECT')
 
-        start_time = time.time()
-        print()
+        self._steps = import_files(self, context)
+        if not self.responsive or not self.invoked or bpy.app.background:
+            for _ in self._steps:
+                pass
+            return {'FINISHED'}
 
-        d = self.properties.directory
-        files = self.properties.files
-        random.seed()
-        import_id = generate_random_id()
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.01, window=context.window)
+        self._last_update = 0
+        wm.modal_handler_add(self)
+        wm.progress_begin(0, 1)
+        return {'RUNNING_MODAL'}
 
-        for i, f in enumerate(files):
-            collection_name = os.path.splitext(f.name)[0]
-            collection = bpy.data.collections.new(collection_name)
-            context.scene.collection.children.link(collection)
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            # Removes what was created for the file that is being imported
+            self._steps.close()
+            self.finish(context)
+            self.report({'WARNING'}, 'Import cancelled')
+            print('\nImport cancelled')
+            # Files imported before cancelling are kept, so it's not
+            # CANCELLED: that would leave them out of the undo history.
+            return {'FINISHED'}
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
 
-            psd_file = os.path.join(d, f.name)
-            try:
-                psd_layers, bboxes, image_size, png_dir = parse_psd(self, psd_file)
-            except TypeError:   # None is returned, so something went wrong.
-                msg = "Something went wrong. '{f}' is not imported!".format(f=f.name)
-                self.report({'ERROR'}, msg)
-                print("*** {}".format(msg))
-                continue
-            create_objects(self, psd_layers, bboxes, image_size,
-                           png_dir, f.name, import_id, collection)
-            print(''.join(('  Done', 114 * ' ')))
+        # Work for a short while, then give the UI time to respond
+        deadline = time.time() + TIME_SLICE
+        try:
+            while time.time() < deadline:
+                progress = next(self._steps)
+        except StopIteration:
+            self.finish(context)
+            return {'FINISHED'}
+        except Exception:
+            # import_files already removed what it created for the file
+            self.finish(context)
+            raise
+        now = time.time()
+        if now - self._last_update > PROGRESS_INTERVAL:
+            self._last_update = now
+            context.window_manager.progress_update(progress)
+            context.workspace.status_text_set(
+                'Importing PSD: {:.0f}%  (Esc to cancel)'.format(progress * 100))
+        return {'RUNNING_MODAL'}
 
-        if len(files) > 1:
-            print_f = 'Files'
-        else:
-            print_f = 'File'
-        print('\n{print_f} imported in {s:.2f} seconds'.format(
-            print_f=print_f, s=time.time() - start_time))
+    def finish(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
 
+
+class SwitchLayerResolution(bpy.types.Operator):
+
+    '''Switch the images of all imported psd layers between full resolution and proxies'''
+    bl_idname = 'image.psd_layer_resolution'
+    bl_label = 'PSD Layer Resolution'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    resolution: EnumProperty(
+        name='Resolution',
+        description='Resolution of the layer images in the viewport, renders always use '
+                    'the full resolution',
+        items=RESOLUTIONS,
+        default='1')
+
+    def execute(self, context):
+        changed = set_layer_resolution(self.resolution)
+        self.report({'INFO'}, '{} layer materials switched'.format(changed))
+        return {'FINISHED'}
+
+
+class WatchPsdFiles(bpy.types.Operator):
+
+    '''Import psd files again when they are saved, start or stop watching the psd files imported into the scene'''
+    bl_idname = 'import_scene.psd_watch'
+    bl_label = 'Watch PSD Files'
+    bl_options = {'REGISTER'}
+
+    interval: FloatProperty(
+        name='Interval',
+        description='Seconds between checks of the psd files',
+        min=0.1,
+        default=WATCH_INTERVAL)
+    debounce: FloatProperty(
+        name='Debounce',
+        description='Seconds a saved psd file has to stay the same before it is imported again',
+        min=0,
+        default=WATCH_DEBOUNCE)
+
+    def execute(self, context):
+        if is_watching():
+            stop_watch()
+            self.report({'INFO'}, 'Stopped watching psd files')
+            return {'FINISHED'}
+        error = load_dependencies()
+        if error is not None:
+            self.report({'ERROR'}, error)
+            return {'CANCELLED'}
+        start_watch(self.interval, self.debounce)
+        self.report({'INFO'}, 'Watching the imported psd files')
         return {'FINISHED'}
@@ -0,0 +1,896 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Layer decoding and png export. This module must not import bpy: it is
+# also imported by the worker processes of the parallel export, which run
+# in a plain Python interpreter.
+
+
+import os
+import time
+import json
+import shutil
+import hashlib
+import multiprocessing
+import concurrent.futures
+import numpy
+import psd_tools
+from PIL import Image
+from psd_tools.constants import ChannelID, ColorMode, Resource
+from . import psd_reader
+try:
+    from psd_tools.api.pil_io import post_process
+except ImportError:  # Older psd_tools, always decode with topil()
+    post_process = None
+
+
+def open_psd(psd_file, fast_reader=True):
+    '''
+    open_psd(string psd_file, bool fast_reader) -> psd
+
+        Opens psd_file with the built-in reader (see psd_reader.py), or
+        with psd_tools when fast_reader is False or the reader doesn't
+        support the file. get_layers() gives the same layers for both.
+    '''
+
+    if fast_reader:
+        try:
+            return psd_reader.PSDFile(psd_file)
+        except psd_reader.UnsupportedFile as err:
+            print('  - {}, reading the psd file with psd_tools'.format(err))
+    return psd_tools.PSDImage.open(psd_file)
+
+
+def close_psd(psd):
+    '''
+    close_psd(psd)
+
+        Lets go of the file of psd when it was opened by the built-in
+        reader. Its layers can still be decoded, that opens it again.
+    '''
+
+    if isinstance(psd, psd_reader.PSDFile):
+        psd.close()
+
+
+def get_layers(layer, all_layers=None):
+    '''
+    get_layers(psd_tools layer) -> list layers
+
+        Returns all sub layers of layer, depth first and from the
+        bottom of the stack to the top.
+    '''
+
+    if all_layers is None:
+        all_layers = []
+    if not layer.is_group():
+        return all_layers
+    for sub_layer in reversed(layer):  # reversed() since psd_tools 1.8
+        all_layers.append(sub_layer)
+        get_layers(sub_layer, all_layers=all_layers)
+    return all_layers
+
+
+def alpha_bbox(alpha):
+    '''
+    alpha_bbox(numpy.ndarray alpha) -> tuple bbox
+
+        Returns the bounding box of the non transparent pixels of the 2D
+        alpha array, like PIL's Image.getbbox(). Returns None when all
+        pixels are transparent.
+    '''
+
+    rows = numpy.flatnonzero(alpha.any(axis=1))
+    if not len(rows):
+        return None
+    columns = numpy.flatnonzero(alpha.any(axis=0))
+    return (int(columns[0]), int(rows[0]), int(columns[-1]) + 1, int(rows[-1]) + 1)
+
+
+def _decode_channel(layer, channel_data):
+    data = channel_data.get_data(layer.width, layer.height, 8, layer._psd.version)
+    return numpy.frombuffer(data, dtype=numpy.uint8).reshape(layer.height, layer.width)
+
+
+def _decode_cropped_layer(layer):
+    # Decodes the alpha channel first and only copies the cropped part
+    # of the color channels, instead of building and searching the
+    # merged image of the whole layer. Only 8 bit RGB layers with
+    # transparency, anything else returns None and goes through topil().
+    # Uses psd_tools internals, decode_layer() also falls back to topil()
+    # when those changed (AttributeError).
+    psd = layer._psd
+    if (post_process is None or psd.depth != 8 or psd.color_mode != ColorMode.RGB or
+            not layer.width or not layer.height):
+        return None
+    channels = {info.id: data for info, data in zip(layer._record.channel_info, layer._channels)}
+    if any(c not in channels for c in (-1, 0, 1, 2)):
+        return None
+    alpha = _decode_channel(layer, channels[-1])
+    bbox = alpha_bbox(alpha)
+    left, top, right, bottom = bbox or (0, 0, layer.width, layer.height)
+    rgb = numpy.empty((bottom - top, right - left, 3), dtype=numpy.uint8)
+    for i in range(3):
+        rgb[..., i] = _decode_channel(layer, channels[i])[top:bottom, left:right]
+    alpha = alpha[top:bottom, left:right]
+    icc = None
+    if Resource.ICC_PROFILE in psd.image_resources:
+        icc = psd.image_resources.get_data(Resource.ICC_PROFILE)
+    layer_image = post_process(Image.fromarray(rgb, 'RGB'),
+                               Image.fromarray(numpy.ascontiguousarray(alpha), 'L'),
+                               icc)
+    return layer_image, bbox
+
+
+def _decode_reader_layer(layer, crop):
+    pixels, bbox = psd_reader.decode_layer(layer, crop)
+    icc = layer.psd.icc_profile
+    if icc is None or post_process is None:
+        return Image.fromarray(pixels, 'RGBA' if pixels.shape[2] == 4 else 'RGB'), bbox
+    alpha = None
+    if pixels.shape[2] == 4:
+        alpha = Image.fromarray(numpy.ascontiguousarray(pixels[..., 3]), 'L')
+    layer_image = post_process(Image.fromarray(numpy.ascontiguousarray(pixels[..., :3]), 'RGB'),
+                               alpha, icc)
+    return layer_image, bbox
+
+
+def decode_layer(layer, crop):
+    '''
+    decode_layer(psd_tools layer, bool crop) -> PIL.Image layer_image, tuple bbox
+
+        Decodes layer, a psd_tools layer or one of the built-in reader.
+        Returns its image and the crop bounding box (relative to the
+        layer), which is None when crop is False.
+
+        Raises ValueError when the layer can not be decoded.
+    '''
+
+    if isinstance(layer, psd_reader.Layer):
+        return _decode_reader_layer(layer, crop)
+    if crop:
+        try:
+            decoded = _decode_cropped_layer(layer)
+        except AttributeError:
+            # Another psd_tools version, topil() is its public api
+            decoded = None
+        if decoded is not None:
+            return decoded
+    layer_image = layer.topil()
+    bbox = None
+    ## AUTOCROP
+    if crop:
+        bbox = layer_image.getbbox()
+        layer_image = layer_image.crop(bbox)
+    return layer_image, bbox
+
+
+def layer_pixel_bytes(layer):
+    '''
+    layer_pixel_bytes(psd_tools layer) -> int size
+
+        Estimates the memory the pixels of layer take while it is
+        exported: its decoded channels and the image made from them.
+    '''
+
+    if isinstance(layer, psd_reader.Layer):
+        return layer.width * layer.height * (len(layer.channels) + 4)
+    # RGBA when psd_tools doesn't have its channels where they used to be
+    channels = len(getattr(layer, '_channels', ())) or 4
+    return layer.width * layer.height * (channels + 4)
+
+
+def release_layer_data(layer):
+    '''
+    release_layer_data(psd_tools layer)
+
+        Drops the compressed channel data psd_tools keeps in memory for
+        layer. Do this once it is exported, the layer can't be decoded
+        anymore. Its name, bounding box and so on are kept. The built-in
+        reader keeps no data in memory, its layers are left alone.
+    '''
+
+    if isinstance(layer, psd_reader.Layer):
+        return
+    # Nothing is released when psd_tools keeps the data elsewhere
+    for channel_data in getattr(layer, '_channels', ()):
+        channel_data.data = b''
+
+
+def image_to_pixels(layer_image):
+    '''
+    image_to_pixels(PIL.Image layer_image) -> numpy.ndarray pixels
+
+        Returns the pixels of layer_image as a flat array of float RGBA
+        values, bottom row first, as Blender's Image.pixels expects.
+    '''
+
+    pixels = numpy.asarray(layer_image.convert('RGBA'), dtype=numpy.float32)
+    pixels = pixels[::-1].ravel()
+    pixels /= 255
+    return pixels
+
+
+# File extension per export format
+IMAGE_EXTENSIONS = {'PNG': '.png', 'TARGA': '.tga', 'WEBP': '.webp'}
+
+
+def to_palette(layer_image):
+    '''
+    to_palette(PIL.Image layer_image) -> PIL.Image palette_image
+
+        Returns layer_image as a palette image with the alpha of every
+        color in its 'transparency' info, without losing any color.
+        Returns None when layer_image has more than 256 colors.
+    '''
+
+    if layer_image.mode != 'RGBA':
+        layer_image = layer_image.convert('RGBA')
+    if layer_image.getcolors(256) is None:
+        return None
+    # One uint32 per pixel makes finding the colors a lot faster
+    pixels = numpy.ascontiguousarray(numpy.asarray(layer_image)).view(numpy.uint32)
+    colors, indices = numpy.unique(pixels.ravel(), return_inverse=True)
+    colors = colors.view(numpy.uint8).reshape(-1, 4)
+    palette_image = Image.fromarray(indices.reshape(pixels.shape[:2]).astype(numpy.uint8), 'P')
+    palette_image.putpalette(colors[:, :3].tobytes())
+    palette_image.info['transparency'] = colors[:, 3].tobytes()
+    return palette_image
+
+
+def save_image(layer_image, image_file, save_options=None):
+    '''
+    save_image(PIL.Image layer_image, string image_file, dict save_options)
+
+        Saves layer_image losslessly in the format save_options asks for.
+
+        dict save_options - 'format': 'PNG' (default), 'TARGA' (uncompressed)
+                            or 'WEBP'
+                            'compress_level': zlib level of png's (0 - 9)
+                            'palette': save png's of images with at most
+                            256 colors with a palette
+        An existing image_file is replaced, not written into, so its
+        hard links (see link_image()) keep the old pixels.
+    '''
+
+    save_options = save_options or {}
+    image_format = save_options.get('format', 'PNG')
+    saved_file = image_file
+    image_file = saved_file + '.tmp'
+    if image_format == 'TARGA':
+        layer_image.save(image_file, 'TGA', rle=False)
+    elif image_format == 'WEBP':
+        if layer_image.mode not in ('RGB', 'RGBA'):
+            layer_image = layer_image.convert('RGBA')
+        # exact keeps the color of transparent pixels, like png does
+        layer_image.save(image_file, 'WEBP', lossless=True, exact=True)
+    else:
+        if save_options.get('palette'):
+            palette_image = to_palette(layer_image)
+            if palette_image is not None:
+                layer_image = palette_image
+        kwargs = {}
+        if 'compress_level' in save_options:
+            kwargs['compress_level'] = save_options['compress_level']
+        layer_image.save(image_file, 'PNG', **kwargs)
+    os.replace(image_file, saved_file)
+
+
+def link_image(image_file, link_file):
+    '''
+    link_image(string image_file, string link_file)
+
+        Makes link_file a hard link to image_file, or a copy of it where
+        hard links can't be made. An existing link_file is replaced.
+    '''
+
+    tmp_file = link_file + '.tmp'
+    if os.path.lexists(tmp_file):
+        os.remove(tmp_file)
+    try:
+        os.link(image_file, tmp_file)
+    except OSError:
+        shutil.copyfile(image_file, tmp_file)
+    os.replace(tmp_file, link_file)
+
+
+def same_directory(file_a, file_b):
+    return (os.path.normcase(os.path.dirname(os.path.abspath(file_a))) ==
+            os.path.normcase(os.path.dirname(os.path.abspath(file_b))))
+
+
+# How many times smaller the proxy images are than their image
+PROXY_FACTORS = (2, 4)
+
+
+def proxy_path(image_file, factor):
+    '''
+    proxy_path(string image_file, int factor) -> string proxy_file
+
+        Returns the file of the proxy of image_file that is factor times
+        smaller: <name>.proxy<factor><extension>, next to image_file.
+    '''
+
+    name, extension = os.path.splitext(image_file)
+    return '{}.proxy{}{}'.format(name, factor, extension)
+
+
+def write_proxies(image_file, factors=PROXY_FACTORS, save_options=None):
+    '''
+    write_proxies(string image_file, tuple factors, dict save_options)
+                  -> dict proxy_files
+
+        Saves copies of image_file that are factor times smaller (see
+        proxy_path()). A proxy that is newer than image_file is kept.
+        Returns the proxy file per factor.
+    '''
+
+    image_time = os.stat(image_file).st_mtime
+    proxy_files = {factor: proxy_path(image_file, factor) for factor in factors}
+    outdated = []
+    for factor, proxy_file in proxy_files.items():
+        try:
+            if os.stat(proxy_file).st_mtime >= image_time:
+                continue
+        except OSError:
+            pass
+        outdated.append(factor)
+    if outdated:
+        with Image.open(image_file) as layer_image:
+            if layer_image.mode == 'P':
+                layer_image = layer_image.convert('RGBA')
+            for factor in outdated:
+                # reduce() averages the colors weighted by their alpha
+                save_image(layer_image.reduce(factor), proxy_files[factor], save_options)
+    return proxy_files
+
+
+def save_empty_image(image_file, save_options=None):
+    '''
+    save_empty_image(string image_file, dict save_options)
+
+        Saves a single transparent pixel, for frames without a layer.
+    '''
+
+    save_image(Image.new('RGBA', (1, 1)), image_file, save_options)
+
+
+def export_layer(layer, png_file, crop, timings=None, save_options=None):
+    '''
+    export_layer(psd_tools layer, string png_file, bool crop,
+                 dict timings, dict save_options) -> tuple bbox
+
+        Decodes layer and saves it as png_file, or in another format
+        with save_options (see save_image()). Returns the crop bounding
+        box (relative to the layer) or None when crop is False.
+        When timings is given, the seconds spent decoding and encoding
+        are stored in it as 'decode' and 'encode'.
+
+        Raises ValueError when the layer can not be decoded.
+    '''
+
+    start = time.perf_counter()
+    layer_image, bbox = decode_layer(layer, crop)
+    decoded = time.perf_counter()
+    save_image(layer_image, png_file, save_options)
+    if timings is not None:
+        timings['decode'] = decoded - start
+        timings['encode'] = time.perf_counter() - decoded
+    return bbox
+
+
+def pixel_hash(layer_image):
+    '''
+    pixel_hash(PIL.Image layer_image) -> string hash
+
+        Hashes the pixels of layer_image. Images with the same mode, size
+        and pixels get the same hash, wherever they are in the psd.
+    '''
+
+    h = hashlib.sha1()
+    h.update(repr((layer_image.mode, layer_image.size)).encode())
+    h.update(layer_image.tobytes())
+    return h.hexdigest()
+
+
+def export_unique_layer(layer, png_file, crop, unique_files, timings=None, save_options=None):
+    '''
+    export_unique_layer(psd_tools layer, string png_file, bool crop,
+                        dict unique_files, dict timings, dict save_options)
+                        -> tuple bbox, string image_file, string content_hash
+
+        Like export_layer(), but only saves png_file when no image with
+        the same pixels was saved before. unique_files maps the pixel
+        hashes to the files they were saved as and is updated.
+        Returns the crop bounding box, the file that has the pixels of
+        layer (png_file or the earlier one) and the pixel hash.
+        An earlier image of another directory (another psd file) is
+        linked to png_file (see link_image()) and png_file is returned,
+        so every psd file only uses the pngs in its own directory.
+        timings also gets the seconds spent hashing as 'hash'.
+
+        Raises ValueError when the layer can not be decoded.
+    '''
+
+    start = time.perf_counter()
+    layer_image, bbox = decode_layer(layer, crop)
+    decoded = time.perf_counter()
+    content_hash = pixel_hash(layer_image)
+    image_file = unique_files.setdefault(content_hash, png_file)
+    hashed = time.perf_counter()
+    if image_file == png_file:
+        save_image(layer_image, png_file, save_options)
+    elif not same_directory(image_file, png_file):
+        link_image(image_file, png_file)
+        image_file = png_file
+    if timings is not None:
+        timings['decode'] = decoded - start
+        timings['hash'] = hashed - decoded
+        timings['encode'] = time.perf_counter() - hashed
+    return bbox, image_file, content_hash
+
+
+def _dilate_rows(left, right, margin):
+    # Grows the opaque span of every row by margin pixels in all
+    # directions, also into the transparent rows next to it
+    grown_left = left.copy()
+    grown_right = right.copy()
+    for offset in range(1, margin + 1):
+        numpy.minimum(grown_left[offset:], left[:-offset], out=grown_left[offset:])
+        numpy.minimum(grown_left[:-offset], left[offset:], out=grown_left[:-offset])
+        numpy.maximum(grown_right[offset:], right[:-offset], out=grown_right[offset:])
+        numpy.maximum(grown_right[:-offset], right[offset:], out=grown_right[:-offset])
+    return grown_left - margin, grown_right + margin
+
+
+def _outline_strips(left, right, edges):
+    # Strips of quads between the band edges, split at empty bands
+    strips = []
+    strip = []
+    for top, bottom in zip(edges[:-1], edges[1:]):
+        band_left = int(left[top:bottom].min())
+        band_right = int(right[top:bottom].max())
+        if band_left >= band_right:
+            if strip:
+                strips.append(strip)
+            strip = []
+            continue
+        strip.append((top, bottom, band_left, band_right))
+    if strip:
+        strips.append(strip)
+    return strips
+
+
+def alpha_outline(alpha, max_vertices=32, margin=2):
+    '''
+    alpha_outline(numpy.ndarray alpha, int max_vertices, int margin)
+                  -> list verts, list faces
+
+        Returns a mesh that covers all non transparent pixels of the 2D
+        alpha array, grown by margin pixels, and as little else as it
+        can with at most max_vertices vertices. The image is cut into
+        horizontal bands and every band gets a quad from the left to the
+        right most pixel in it. The quads of neighbouring bands share
+        their vertices, the edge between them is as wide as the widest
+        of the two. Empty bands are left out.
+        The verts are (u, v) positions on the image, from (0, 0) at the
+        bottom left to (1, 1) at the top right. The faces are tuples of
+        the indices of their bottom left, bottom right, top right and
+        top left verts. Returns None when all pixels are transparent.
+    '''
+
+    height, width = alpha.shape
+    opaque = alpha > 0
+    rows = opaque.any(axis=1)
+    if not rows.any():
+        return None
+    # Span of opaque pixels per row, empty rows have left >= right
+    left = numpy.where(rows, opaque.argmax(axis=1), width)
+    right = numpy.where(rows, width - opaque[:, ::-1].argmax(axis=1), 0)
+    if margin > 0:
+        left, right = _dilate_rows(left, right, margin)
+    left = numpy.clip(left, 0, width)
+    right = numpy.clip(right, 0, width)
+    filled = numpy.flatnonzero(left < right)
+    first_row, last_row = int(filled[0]), int(filled[-1]) + 1
+    # Fewer bands until the vertices fit, empty bands cost extra vertices
+    for bands in range(max(1, max_vertices // 2 - 1), 0, -1):
+        edges = numpy.unique(numpy.linspace(first_row, last_row, bands + 1).round().astype(int))
+        strips = _outline_strips(left, right, edges)
+        if sum(2 * (len(strip) + 1) for strip in strips) <= max_vertices:
+            break
+    verts = []
+    faces = []
+    for strip in strips:
+        # Every band edge gets a left and a right vertex
+        lefts = [strip[0][2]] + [min(a[2], b[2]) for a, b in zip(strip[:-1], strip[1:])] + [strip[-1][2]]
+        rights = [strip[0][3]] + [max(a[3], b[3]) for a, b in zip(strip[:-1], strip[1:])] + [strip[-1][3]]
+        ys = [strip[0][0]] + [band[1] for band in strip]
+        start = len(verts)
+        for x_left, x_right, y in zip(lefts, rights, ys):
+            v = 1 - y / height
+            verts.append((x_left / width, v))
+            verts.append((x_right / width, v))
+        for band in range(len(strip)):
+            top = start + 2 * band
+            bottom = top + 2
+            faces.append((bottom, bottom + 1, top + 1, top))
+    return verts, faces
+
+
+def image_outline(layer_image, max_vertices=32, margin=2):
+    '''
+    image_outline(PIL.Image layer_image, int max_vertices, int margin)
+                  -> list verts, list faces
+
+        alpha_outline() of the alpha channel of layer_image. Returns None
+        when the image has no alpha channel or is fully transparent.
+    '''
+
+    if layer_image.mode == 'P':
+        layer_image = layer_image.convert('RGBA')
+    if 'A' not in layer_image.getbands():
+        return None
+    alpha = numpy.asarray(layer_image.getchannel('A'))
+    return alpha_outline(alpha, max_vertices, margin)
+
+
+def image_file_outline(image_file, max_vertices=32, margin=2):
+    with Image.open(image_file) as layer_image:
+        return image_outline(layer_image, max_vertices, margin)
+
+
+def _place_on_atlas(atlas, width, height, max_size):
+    # Puts the rectangle on the first shelf it fits on, else on a new
+    # shelf below the others. Returns None when the atlas is full.
+    shelves = atlas[2]
+    for shelf in shelves:
+        shelf_y, shelf_height, shelf_x = shelf
+        if height <= shelf_height and shelf_x + width <= max_size:
+            shelf[2] += width
+            atlas[0] = max(atlas[0], shelf[2])
+            return shelf_x, shelf_y
+    if atlas[1] + height > max_size:
+        return None
+    y = atlas[1]
+    shelves.append([y, height, width])
+    atlas[0] = max(atlas[0], width)
+    atlas[1] += height
+    return 0, y
+
+
+def pack_rectangles(sizes, max_size, padding=0):
+    '''
+    pack_rectangles(list sizes, int max_size, int padding) -> list positions, list atlas_sizes
+
+        Packs rectangles with (width, height) sizes on as few atlases of
+        at most max_size x max_size pixels as it can, in rows from the
+        tallest to the lowest rectangle. padding pixels around every
+        rectangle are kept free.
+        Returns the (atlas index, x, y) position of every rectangle and
+        the (width, height) of every atlas. A rectangle larger than
+        max_size gets an atlas of its own.
+    '''
+
+    positions = [None] * len(sizes)
+    # [width, height, shelves] per atlas, a shelf is [y, height, used width].
+    # Atlases of a single oversized rectangle have no shelves list.
+    atlases = []
+    order = sorted(range(len(sizes)), key=lambda i: (sizes[i][1], sizes[i][0]), reverse=True)
+    for i in order:
+        width = sizes[i][0] + 2 * padding
+        height = sizes[i][1] + 2 * padding
+        if width > max_size or height > max_size:
+            atlases.append([width, height, None])
+            positions[i] = (len(atlases) - 1, padding, padding)
+            continue
+        for atlas_index, atlas in enumerate(atlases):
+            if atlas[2] is None:
+                continue
+            position = _place_on_atlas(atlas, width, height, max_size)
+            if position is not None:
+                break
+        else:
+            atlases.append([0, 0, []])
+            atlas_index = len(atlases) - 1
+            position = _place_on_atlas(atlases[-1], width, height, max_size)
+        positions[i] = (atlas_index, position[0] + padding, position[1] + padding)
+    return positions, [(atlas[0], atlas[1]) for atlas in atlases]
+
+
+def build_atlases(image_files, atlas_prefix, max_size, padding=0, save_options=None):
+    '''
+    build_atlases(list image_files, string atlas_prefix, int max_size,
+                  int padding, dict save_options) -> list regions
+
+        Packs the images in image_files on atlases and saves these as
+        <atlas_prefix>_<index>.png, or in the format of save_options
+        (see save_image()). Only one atlas is in memory at a time.
+        Returns the region of every image as (atlas file, atlas size,
+        (x, y, width, height)), in pixels from the top left.
+    '''
+
+    sizes = []
+    for image_file in image_files:
+        with Image.open(image_file) as image:  # Only reads the header
+            sizes.append(image.size)
+    positions, atlas_sizes = pack_rectangles(sizes, max_size, padding)
+    extension = IMAGE_EXTENSIONS[(save_options or {}).get('format', 'PNG')]
+    atlas_files = [''.join((atlas_prefix, '_', str(i), extension)) for i in range(len(atlas_sizes))]
+    for atlas_index, atlas_size in enumerate(atlas_sizes):
+        atlas = Image.new('RGBA', atlas_size)
+        for image_file, (image_atlas, x, y) in zip(image_files, positions):
+            if image_atlas != atlas_index:
+                continue
+            with Image.open(image_file) as image:
+                atlas.paste(image.convert('RGBA'), (x, y))
+        save_image(atlas, atlas_files[atlas_index], save_options)
+    return [(atlas_files[a], atlas_sizes[a], (x, y) + size)
+            for (a, x, y), size in zip(positions, sizes)]
+
+
+MANIFEST_NAME = 'export_manifest.json'
+MANIFEST_VERSION = 1
+
+
+def layer_hash(layer):
+    '''
+    layer_hash(psd_tools layer) -> string hash
+
+        Hashes the raw (still compressed) channel data and the bounding
+        box of layer. Only reads data psd_tools already holds in memory,
+        nothing is decoded. A layer of the built-in reader gets the same
+        hash as the psd_tools layer. When the psd_tools internals it
+        reads changed, the decoded pixels of the layer are hashed.
+    '''
+
+    h = hashlib.sha1()
+    if isinstance(layer, psd_reader.Layer):
+        psd = layer.psd
+        h.update(repr((psd.depth, str(ColorMode(psd.color_mode)), layer.bbox)).encode())
+        for channel in layer.channels:
+            try:
+                channel_id = ChannelID(channel.id)
+            except ValueError:
+                channel_id = channel.id
+            h.update(repr((channel_id, channel.compression, channel.length)).encode())
+            h.update(psd_reader.channel_bytes(layer, channel))
+        return h.hexdigest()
+    try:
+        psd = layer._psd
+        h.update(repr((psd.depth, str(psd.color_mode), layer.bbox)).encode())
+        for info, data in zip(layer._record.channel_info, layer._channels):
+            h.update(repr((info.id, int(data.compression), len(data.data))).encode())
+            h.update(data.data)
+    except AttributeError:
+        h = hashlib.sha1(repr(('pixels', layer.bbox)).encode())
+        layer_image = layer.topil()
+        if layer_image is not None:
+            h.update(repr((layer_image.mode, layer_image.size)).encode())
+            h.update(layer_image.tobytes())
+    return h.hexdigest()
+
+
+def load_manifest(png_dir):
+    '''
+    load_manifest(string png_dir) -> dict manifest
+
+        Returns the layers exported to png_dir by earlier imports, keyed
+        by png file name. Returns an empty dict when there is no
+        (usable) manifest.
+    '''
+
+    try:
+        with open(os.path.join(png_dir, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('layers', {})
+
+
+def save_manifest(png_dir, layers):
+    '''
+    save_manifest(string png_dir, dict layers)
+
+        Writes the manifest of png_dir. The file is replaced atomically,
+        so an interrupted import never leaves a broken manifest.
+    '''
+
+    manifest_file = os.path.join(png_dir, MANIFEST_NAME)
+    tmp_file = manifest_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump({'version': MANIFEST_VERSION, 'layers': layers}, f, indent=1, sort_keys=True)
+    os.replace(tmp_file, manifest_file)
+
+
+def manifest_entry(png_file, layer_hash, settings, bbox, image_file=None, content_hash=None):
+    '''
+    manifest_entry(string png_file, string layer_hash, dict settings,
+                   tuple bbox, string image_file, string content_hash) -> dict entry
+
+        Creates the manifest entry for a freshly exported png_file.
+        When the pixels of the layer were already saved as another file,
+        image_file is that file. content_hash is the pixel hash of the
+        layer, if known.
+    '''
+
+    if image_file is None:
+        image_file = png_file
+    png_dir = os.path.dirname(png_file)
+    try:
+        image = os.path.relpath(image_file, png_dir)
+    except ValueError:  # Another drive on Windows
+        image = os.path.abspath(image_file)
+    stat = os.stat(image_file)
+    return {'hash': layer_hash,
+            'settings': settings,
+            'bbox': list(bbox) if bbox is not None else None,
+            'image': image,
+            'pixels': content_hash,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime}
+
+
+def cached_export(entry, png_file, layer_hash, settings):
+    '''
+    cached_export(dict entry, string png_file, string layer_hash,
+                  dict settings) -> bool valid, tuple bbox,
+                                    string image_file, string content_hash
+
+        Checks if the export of png_file, described by manifest entry, is
+        still valid for the layer with layer_hash using settings. The
+        image file must not have been changed or removed since it was
+        exported. Returns the crop bounding box, the file that has the
+        pixels of the layer and their hash (None when not known).
+    '''
+
+    if (entry is None or entry.get('hash') != layer_hash or
+            entry.get('settings') != settings):
+        return False, None, None, None
+    # Entries written before identical layers were shared have no image
+    image_file = os.path.normpath(os.path.join(os.path.dirname(png_file),
+                                               entry.get('image', os.path.basename(png_file))))
+    try:
+        stat = os.stat(image_file)
+    except OSError:
+        return False, None, None, None
+    if stat.st_size != entry.get('size') or stat.st_mtime != entry.get('mtime'):
+        return False, None, None, None
+    bbox = entry.get('bbox')
+    bbox = tuple(bbox) if bbox is not None else None
+    return True, bbox, image_file, entry.get('pixels')
+
+
+# Layers of the psd file a worker process is exporting, set by _init_worker.
+_worker_layers = None
+# Pixel hash -> png file of the layers this worker saved
+_worker_unique_files = {}
+
+
+def _init_worker(psd_file, fast_reader):
+    global _worker_layers
+    _worker_layers = get_layers(open_psd(psd_file, fast_reader))
+
+
+def _export_worker(index, png_file, crop, dedupe, save_options, release):
+    timings = {}
+    layer = _worker_layers[index]
+    try:
+        if dedupe:
+            return export_unique_layer(layer, png_file, crop, _worker_unique_files,
+                                       timings, save_options), timings
+        return (export_layer(layer, png_file, crop, timings, save_options), png_file, None), timings
+    except ValueError:
+        print("Could not process layer " + _worker_layers[index].name)
+        raise
+    finally:
+        if release:
+            release_layer_data(layer)
+
+
+def export_layers_parallel(psd_file, jobs, crop, workers=0, executable=None, dedupe=False,
+                           save_options=None, job_bytes=None, memory_budget=0, release=False,
+                           fast_reader=True, timeout=None):
+    '''
+    export_layers_parallel(string psd_file, list jobs, bool crop,
+                           int workers, string executable, bool dedupe,
+                           dict save_options, list job_bytes, int memory_budget,
+                           bool release, bool fast_reader, float timeout)
+                           -> iterator
+
+        Exports layers of psd_file with a pool of worker processes.
+        Every worker opens psd_file once (see open_psd()) and then
+        decodes, crops and saves the layers it gets.
+        Yields (index, result, timings) tuples in order of completion.
+        result is (bbox, image_file, content_hash) like
+        export_unique_layer() returns, timings has the seconds the
+        worker spent per stage. When a layer could not be decoded
+        (index, ValueError, {}) is yielded instead.
+        With dedupe every worker saves identical layers only once, but
+        different workers can still save the same pixels. Without it
+        image_file is always the png file of the job and content_hash
+        is None.
+
+        string psd_file   - the filepath of the psd file
+        list jobs         - (layer index, png filepath) tuples, the index
+                            is the index in get_layers(psd)
+        bool crop         - crop the layers according to their transparency
+        int workers       - number of processes, 0 uses all cores
+        string executable - the Python interpreter to start the workers
+                            with (Blender's own binary can not be used)
+        bool dedupe       - save identical layers once per worker
+        dict save_options - the format to save in, see save_image()
+        list job_bytes    - the pixel memory every job needs (see
+                            layer_pixel_bytes()), needed for memory_budget
+        int memory_budget - only start a job when the pixel memory of
+                            all running jobs stays below this (in bytes).
+                            A single job is always started. 0 doesn't
+                            limit the number of jobs.
+        bool release      - the workers drop the data of a layer once it
+                            is exported (see release_layer_data())
+        bool fast_reader  - open psd_file with the built-in reader
+        float timeout     - yield None when no layer was done within this
+                            many seconds, so the caller can do other
+                            things in the meantime. None waits for a layer.
+    '''
+
+    workers = workers or os.cpu_count() or 1
+    context = multiprocessing.get_context('spawn')
+    if executable:
+        context.set_executable(executable)
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(workers, max(len(jobs), 1)),
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(psd_file, fast_reader)) as executor:
+        # future -> (layer index, pixel memory)
+        futures = {}
+        pending_bytes = 0
+        next_job = 0
+        try:
+            while next_job < len(jobs) or futures:
+                while next_job < len(jobs):
+                    size = job_bytes[next_job] if memory_budget else 0
+                    if futures and pending_bytes + size > memory_budget:
+                        break
+                    index, png_file = jobs[next_job]
+                    future = executor.submit(_export_worker, index, png_file, crop, dedupe,
+                                             save_options, release)
+                    futures[future] = (index, size)
+                    pending_bytes += size
+                    next_job += 1
+                done, not_done = concurrent.futures.wait(
+                    futures, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+                if not done:
+                    yield None
+                for future in done:
+                    index, size = futures.pop(future)
+                    pending_bytes -= size
+                    try:
+                        result, timings = future.result()
+                    except ValueError as err:
+                        yield index, err, {}
+                    else:
+                        yield index, result, timings
+        except GeneratorExit:
+            # Stopped early, don't wait for the layers that didn't start yet
+            for future in futures:
+                future.cancel()
+            raise
@@ -0,0 +1,244 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# The layer index: a sidecar file with the layer tree of a psd file and
+# what was exported from it, so an unchanged psd file doesn't have to be
+# opened again. Needs neither bpy nor psd_tools.
+
+
+import os
+import json
+import hashlib
+
+
+INDEX_NAME = 'layer_index.json'
+INDEX_VERSION = 1
+
+
+class IndexedLayer:
+
+    '''
+    A layer of a psd file as stored in the layer index. Has the part of
+    the psd_tools layer api the import uses: name, bbox, parent,
+    is_group() and is_visible(). The parent of a top level layer is None.
+    '''
+
+    def __init__(self, name, bbox, group, visible, parent=None):
+        self.name = name
+        self.bbox = bbox
+        self.group = group
+        self.visible = visible
+        self.parent = parent
+
+    def is_group(self):
+        return self.group
+
+    def is_visible(self):
+        return self.visible and (self.parent is None or self.parent.is_visible())
+
+    @property
+    def width(self):
+        return self.bbox[2] - self.bbox[0]
+
+    @property
+    def height(self):
+        return self.bbox[3] - self.bbox[1]
+
+
+def file_hash(file_name):
+    '''
+    file_hash(string file_name) -> string hash
+
+        Returns the sha1 hash of the contents of file_name.
+    '''
+
+    h = hashlib.sha1()
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def index_path(png_dir):
+    return os.path.join(png_dir, INDEX_NAME)
+
+
+def _relative_path(file_name, png_dir):
+    try:
+        return os.path.relpath(file_name, png_dir)
+    except ValueError:  # Another drive on Windows
+        return os.path.abspath(file_name)
+
+
+def _bbox(bbox):
+    return tuple(bbox) if bbox is not None else None
+
+
+def make_exports(png_dir, settings, bboxes, image_files, atlas_regions=None, pixel_hashes=None):
+    '''
+    make_exports(string png_dir, dict settings, list bboxes,
+                 dict image_files, dict atlas_regions,
+                 dict pixel_hashes) -> dict exports
+
+        Describes what an import exported to png_dir with settings, for
+        save_index(). bboxes are the crop bounding boxes per layer index,
+        image_files and atlas_regions are those of parse_psd().
+        pixel_hashes are the pixel hashes per layer index, when identical
+        layers are shared.
+    '''
+
+    images = {}
+    for image_file in set(image_files.values()):
+        stat = os.stat(image_file)
+        images[_relative_path(image_file, png_dir)] = [stat.st_size, stat.st_mtime]
+    if atlas_regions is not None:
+        for atlas_file, atlas_size, region in atlas_regions.values():
+            stat = os.stat(atlas_file)
+            images[_relative_path(atlas_file, png_dir)] = [stat.st_size, stat.st_mtime]
+    return {
+        'settings': settings,
+        'bboxes': [list(bbox) if bbox is not None else None for bbox in bboxes],
+        'images': images,
+        'layer_images': {str(i): _relative_path(image_file, png_dir)
+                         for i, image_file in image_files.items()},
+        'atlas_regions': None if atlas_regions is None else {
+            str(i): [_relative_path(atlas_file, png_dir), list(atlas_size), list(region)]
+            for i, (atlas_file, atlas_size, region) in atlas_regions.items()},
+        'pixel_hashes': {str(i): pixel_hash for i, pixel_hash in (pixel_hashes or {}).items()},
+        }
+
+
+def save_index(png_dir, psd_file, image_size, layers, exports=None, content_hash=None):
+    '''
+    save_index(string png_dir, string psd_file, tuple image_size,
+               list layers, dict exports, string content_hash)
+
+        Writes the layer index of psd_file to png_dir. layers are the
+        psd_tools (or indexed) layers as returned by get_layers(),
+        exports is what was exported from them (see make_exports()), if
+        anything. The hash of psd_file is computed when content_hash is
+        not given. The file is replaced atomically.
+    '''
+
+    stat = os.stat(psd_file)
+    if content_hash is None:
+        content_hash = file_hash(psd_file)
+    indices = {id(layer): i for i, layer in enumerate(layers)}
+    index = {
+        'version': INDEX_VERSION,
+        'psd': {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': content_hash},
+        'image_size': list(image_size),
+        # Groups come before their children, like in get_layers()
+        'layers': [{'name': layer.name,
+                    'bbox': list(layer.bbox),
+                    'group': layer.is_group(),
+                    'visible': layer.visible,
+                    'parent': indices.get(id(layer.parent))}
+                   for layer in layers],
+        'exports': exports,
+        }
+    index_file = index_path(png_dir)
+    tmp_file = index_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(index, f, separators=(',', ':'), sort_keys=True)
+    os.replace(tmp_file, index_file)
+
+
+def load_index(png_dir, psd_file):
+    '''
+    load_index(string png_dir, string psd_file) -> dict index
+
+        Returns the layer index of psd_file in png_dir, or None when
+        there is none or psd_file changed since it was written. A file
+        with the same size but another modification time is hashed,
+        when only its time changed the index is still used (and updated).
+    '''
+
+    index_file = index_path(png_dir)
+    try:
+        with open(index_file) as f:
+            index = json.load(f)
+        stat = os.stat(psd_file)
+    except (OSError, ValueError):
+        return None
+    if index.get('version') != INDEX_VERSION:
+        return None
+    psd = index['psd']
+    if stat.st_size != psd['size']:
+        return None
+    if stat.st_mtime != psd['mtime']:
+        if file_hash(psd_file) != psd['hash']:
+            return None
+        psd['mtime'] = stat.st_mtime
+        tmp_file = index_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(index, f, separators=(',', ':'), sort_keys=True)
+        os.replace(tmp_file, index_file)
+    return index
+
+
+def indexed_layers(index):
+    '''
+    indexed_layers(dict index) -> list layers, tuple image_size
+
+        Returns the layers of the index as IndexedLayer objects, in the
+        order of get_layers(), and the size of the psd file.
+    '''
+
+    layers = []
+    for entry in index['layers']:
+        parent = entry['parent']
+        layers.append(IndexedLayer(entry['name'], tuple(entry['bbox']), entry['group'],
+                                   entry['visible'],
+                                   layers[parent] if parent is not None else None))
+    return layers, tuple(index['image_size'])
+
+
+def indexed_exports(index, png_dir, settings):
+    '''
+    indexed_exports(dict index, string png_dir, dict settings)
+                    -> list bboxes, dict image_files, dict atlas_regions,
+                       dict pixel_hashes
+
+        Returns what parse_psd() returns about the export of the layers
+        when the index has an export with settings and none of its
+        images were changed or removed since, and the pixel hashes of
+        the layers. Else returns None.
+    '''
+
+    exports = index.get('exports')
+    if exports is None or exports['settings'] != settings:
+        return None
+    for image, (size, mtime) in exports['images'].items():
+        try:
+            stat = os.stat(os.path.join(png_dir, image))
+        except OSError:
+            return None
+        if stat.st_size != size or stat.st_mtime != mtime:
+            return None
+    bboxes = [_bbox(bbox) for bbox in exports['bboxes']]
+    image_files = {int(i): os.path.normpath(os.path.join(png_dir, image))
+                   for i, image in exports['layer_images'].items()}
+    atlas_regions = exports['atlas_regions']
+    if atlas_regions is not None:
+        atlas_regions = {int(i): (os.path.normpath(os.path.join(png_dir, atlas_file)),
+                                  tuple(atlas_size), tuple(region))
+                         for i, (atlas_file, atlas_size, region) in atlas_regions.items()}
+    pixel_hashes = {int(i): pixel_hash
+                    for i, pixel_hash in exports.get('pixel_hashes', {}).items()}
+    return bboxes, image_files, atlas_regions, pixel_hashes
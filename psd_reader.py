@@ -0,0 +1,699 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# A reader for the part of the psd and psb format the import uses: the
+# layer tree and the pixels of 8 and 16 bit RGB layers. The file is memory
+# mapped, opening it only reads the layer records, the channels are
+# decoded with numpy when a layer is. Needs neither bpy nor psd_tools,
+# files it can't read are read with psd_tools instead.
+
+
+import os
+import mmap
+import zlib
+import struct
+import numpy
+
+
+SIGNATURE = b'8BPS'
+# The color mode and bit depths the reader decodes
+RGB = 3
+DEPTHS = (8, 16)
+# Image resource with the icc profile
+ICC_PROFILE = 1039
+# Channel compressions
+RAW, RLE, ZIP, ZIP_PREDICTION = range(4)
+# Section divider kinds, the end of a group comes before its layers
+OPEN_FOLDER, CLOSED_FOLDER, BOUNDING_SECTION_DIVIDER = 1, 2, 3
+
+# Tagged blocks that have a 64 bit length in psb files
+_BIG_KEYS = {b'Alph', b'FELS', b'FEid', b'FMsk', b'FXid', b'LMsk', b'Layr', b'Lr16', b'Lr32',
+             b'Mt16', b'Mt32', b'Mtrn', b'PxSD', b'artd', b'cinf', b'extd', b'extn', b'lnk2',
+             b'lnk3', b'lnkE', b'pths'}
+_ARTBOARD_KEYS = (b'artb', b'artd', b'abdd')
+# Output bytes expanded at once by the rle decoder, bounds its index arrays
+_RLE_CHUNK = 1 << 20
+# Per PackBits header byte the bytes its packet decodes to and the size
+# of the packet. 0 - 127 copy the next 1 - 128 bytes, 129 - 255 repeat
+# the next byte 128 - 2 times, 128 is no packet at all.
+_PACKET_COUNTS = numpy.array([n + 1 for n in range(128)] + [0] + [257 - n for n in range(129, 256)],
+                             dtype=numpy.int64)
+_PACKET_SIZES = numpy.array([n + 2 for n in range(128)] + [1] + [2] * 127, dtype=numpy.int64)
+
+
+class UnsupportedFile(ValueError):
+
+    '''
+    Raised when a file is not a psd file or uses something the reader
+    doesn't, like another color mode. Read those with psd_tools.
+    '''
+
+
+class Channel:
+
+    '''
+    A channel of a layer: where its data is in the file and how it is
+    compressed. offset is where the data starts, after the compression.
+    '''
+
+    def __init__(self, channel_id, compression, offset, length):
+        self.id = channel_id
+        self.compression = compression
+        self.offset = offset
+        self.length = length
+
+
+class Layer:
+
+    '''
+    A layer of a psd file. Has the part of the psd_tools layer api the
+    import uses: name, bbox, visible, parent, is_group() and
+    is_visible(). The parent of a top level layer is the PSDFile.
+    '''
+
+    def __init__(self, psd, parent, name, bbox, visible, clipping, channels):
+        self._psd = psd
+        self.parent = parent
+        self.name = name
+        self._bbox = bbox
+        self.visible = visible
+        self.clipping = clipping
+        self.channels = channels
+
+    def is_group(self):
+        return False
+
+    def is_visible(self):
+        return self.visible and self.parent.is_visible()
+
+    @property
+    def bbox(self):
+        return self._bbox
+
+    @property
+    def width(self):
+        return self.bbox[2] - self.bbox[0]
+
+    @property
+    def height(self):
+        return self.bbox[3] - self.bbox[1]
+
+    @property
+    def psd(self):
+        return self._psd
+
+
+class Group(Layer):
+
+    '''
+    A group of layers. Iterating over it gives its layers from the bottom
+    of the stack to the top, like psd_tools does. Its bbox contains the
+    visible layers in it that aren't clipped.
+    '''
+
+    def __init__(self, psd, parent):
+        super().__init__(psd, parent, '', None, True, False, [])
+        self._layers = []
+
+    def is_group(self):
+        return True
+
+    def __iter__(self):
+        return iter(self._layers)
+
+    def __reversed__(self):
+        return reversed(self._layers)
+
+    def __len__(self):
+        return len(self._layers)
+
+    def __getitem__(self, index):
+        return self._layers[index]
+
+    @property
+    def bbox(self):
+        if self._bbox is None:
+            self._bbox = _layers_bbox(self._layers)
+        return self._bbox
+
+
+def _layers_bbox(layers):
+    bboxes = [layer.bbox for layer in layers if layer.is_visible() and not layer.clipping]
+    bboxes = [bbox for bbox in bboxes if bbox != (0, 0, 0, 0)]
+    if not bboxes:
+        return (0, 0, 0, 0)
+    lefts, tops, rights, bottoms = zip(*bboxes)
+    return (min(lefts), min(tops), max(rights), max(bottoms))
+
+
+class _Cursor:
+
+    # Reads big endian values from the memory map
+
+    def __init__(self, data, offset, version):
+        self.data = data
+        self.offset = offset
+        self.version = version
+
+    def read(self, fmt):
+        values = struct.unpack_from('>' + fmt, self.data, self.offset)
+        self.offset += struct.calcsize('>' + fmt)
+        return values
+
+    def read_length(self, big=True):
+        # Lengths of some sections and blocks are 8 bytes in psb files
+        return self.read('Q' if big and self.version == 2 else 'I')[0]
+
+    def skip_block(self):
+        # Skips a block that starts with its 4 byte length
+        length = self.read('I')[0]
+        self.offset += length
+
+    def read_bytes(self, length):
+        if self.offset + length > len(self.data):
+            raise UnsupportedFile('Unexpected end of the file')
+        data = self.data[self.offset:self.offset + length]
+        self.offset += length
+        return data
+
+
+class PSDFile(Group):
+
+    '''
+    PSDFile(string psd_file)
+
+        Opens psd_file (a psd or psb file) and reads its layer tree.
+        The pixels are only read when a layer is decoded, see
+        decode_layer(). Like a psd_tools PSDImage it is the group with
+        the top level layers and its bbox contains all visible layers,
+        or is the canvas when there are none.
+        The file stays memory mapped until close(), decoding a layer of
+        a closed file maps it again.
+
+        Raises UnsupportedFile when the reader can't read psd_file.
+    '''
+
+    def __init__(self, psd_file):
+        super().__init__(self, None)
+        self.filepath = psd_file
+        self.name = os.path.basename(psd_file)
+        self._data = None
+        self._stat = None
+        self._map()
+        try:
+            self._read()
+        except struct.error:
+            self.close()
+            raise UnsupportedFile('Unexpected end of the file')
+        except UnsupportedFile:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _map(self):
+        with open(self.filepath, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if self._stat is not None and (stat.st_size, stat.st_mtime) != self._stat:
+                raise ValueError('{} changed since it was opened'.format(self.filepath))
+            if not stat.st_size:
+                raise UnsupportedFile('Empty file')
+            self._stat = (stat.st_size, stat.st_mtime)
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        '''
+        close()
+
+            Unmaps the file, so it can be saved over (on Windows).
+        '''
+
+        if self._data is not None:
+            try:
+                self._data.close()
+            except BufferError:
+                # Arrays still use it, it is unmapped when they are gone
+                pass
+            self._data = None
+
+    def buffer(self):
+        '''
+        buffer() -> numpy.ndarray data
+
+            Returns the bytes of the file, without copying them.
+        '''
+
+        if self._data is None:
+            self._map()
+        return numpy.frombuffer(self._data, dtype=numpy.uint8)
+
+    def is_visible(self):
+        return True
+
+    @property
+    def bbox(self):
+        if self._bbox is None:
+            bbox = _layers_bbox(self._layers)
+            if bbox == (0, 0, 0, 0):
+                bbox = (0, 0, self.width, self.height)
+            self._bbox = bbox
+        return self._bbox
+
+    @property
+    def width(self):
+        return self._size[0]
+
+    @property
+    def height(self):
+        return self._size[1]
+
+    @property
+    def size(self):
+        return self._size
+
+    def _read(self):
+        cursor = _Cursor(self._data, 0, 1)
+        signature, version, channels, height, width, depth, color_mode = cursor.read('4sH6xHIIHH')
+        if signature != SIGNATURE or version not in (1, 2):
+            raise UnsupportedFile('Not a psd or psb file')
+        if color_mode != RGB or depth not in DEPTHS:
+            raise UnsupportedFile('Color mode {} at {} bits is not supported'.format(color_mode, depth))
+        cursor.version = version
+        self.version = version
+        self.depth = depth
+        self.color_mode = color_mode
+        self._size = (width, height)
+        cursor.skip_block()  # Color mode data
+        self.icc_profile = self._read_image_resources(cursor)
+        self._read_layers(cursor)
+
+    def _read_image_resources(self, cursor):
+        end = cursor.read('I')[0]
+        end += cursor.offset
+        icc_profile = None
+        while cursor.offset + 12 <= end:
+            signature, resource_id, name_length = cursor.read('4sHB')
+            cursor.offset += name_length + (name_length + 1) % 2  # Even padded pascal string
+            length = cursor.read('I')[0]
+            if resource_id == ICC_PROFILE:
+                icc_profile = cursor.read_bytes(length)
+            else:
+                cursor.offset += length
+            cursor.offset += length % 2
+        cursor.offset = end
+        return icc_profile
+
+    def _read_layers(self, cursor):
+        length = cursor.read_length()
+        if not length:
+            return
+        end = cursor.offset + length
+        layer_info_length = cursor.read_length()
+        layer_info_end = cursor.offset + layer_info_length
+        records = []
+        if layer_info_length:
+            records = self._read_layer_info(cursor)
+        cursor.offset = layer_info_end
+        if not records:
+            # 16 bit files keep their layers in a tagged block at the end
+            if self._data[cursor.offset:cursor.offset + 4] not in (b'8BIM', b'8B64'):
+                cursor.skip_block()  # Global layer mask info
+            while cursor.offset + 12 <= end:
+                signature, key = cursor.read('4s4s')
+                block_length = cursor.read_length(key in _BIG_KEYS)
+                if key == b'Lr16':
+                    records = self._read_layer_info(_Cursor(self._data, cursor.offset, self.version))
+                    break
+                cursor.offset += block_length + (-block_length) % 4
+        self._build_tree(records)
+
+    def _read_layer_info(self, cursor):
+        count = abs(cursor.read('h')[0])
+        records = []
+        for i in range(count):
+            records.append(self._read_layer_record(cursor))
+        # The channel data follows the records, in the same order
+        for record in records:
+            for channel in record['channels']:
+                length = channel.length
+                if length >= 2:
+                    channel.compression = cursor.read('H')[0]
+                channel.offset = cursor.offset
+                channel.length = max(length - 2, 0)
+                cursor.offset += channel.length
+        if cursor.offset > len(self._data):
+            raise UnsupportedFile('Unexpected end of the file')
+        return records
+
+    def _read_layer_record(self, cursor):
+        top, left, bottom, right, channel_count = cursor.read('4iH')
+        channels = []
+        for i in range(channel_count):
+            channel_id = cursor.read('h')[0]
+            channels.append(Channel(channel_id, RAW, 0, cursor.read_length()))
+        signature, blend_mode, opacity, clipping, flags, extra_length = cursor.read('4s4sBBBxI')
+        if signature != b'8BIM':
+            raise UnsupportedFile('Broken layer record')
+        end = cursor.offset + extra_length
+        cursor.skip_block()  # Layer mask
+        cursor.skip_block()  # Blending ranges
+        name_length = cursor.read('B')[0]
+        name = cursor.read_bytes(name_length).decode('mac_roman')
+        cursor.offset += (-(name_length + 1)) % 4
+        record = {'bbox': (left, top, right, bottom),
+                  'channels': channels,
+                  'clipping': bool(clipping),
+                  'visible': not flags & 2,
+                  'name': name,
+                  'divider': None,
+                  'artboard': False}
+        while cursor.offset + 12 <= end:
+            signature, key = cursor.read('4s4s')
+            length = cursor.read_length(key in _BIG_KEYS)
+            start = cursor.offset
+            if key == b'luni':
+                chars = cursor.read('I')[0]
+                record['name'] = cursor.read_bytes(2 * chars).decode('utf-16-be', 'replace')
+            elif key in (b'lsct', b'lsdk') and (key == b'lsdk' or record['divider'] is None):
+                record['divider'] = cursor.read('I')[0]
+            elif key in _ARTBOARD_KEYS:
+                record['artboard'] = True
+            cursor.offset = start + length
+        cursor.offset = end
+        return record
+
+    def _build_tree(self, records):
+        # Like psd_tools: a group is created at the end of its group and
+        # gets its name and visibility at its start, which comes later.
+        # Unbalanced dividers are ignored.
+        opened = []
+        unmatched = set()
+        for i, record in enumerate(records):
+            if record['divider'] == BOUNDING_SECTION_DIVIDER:
+                opened.append(i)
+            elif record['divider'] in (OPEN_FOLDER, CLOSED_FOLDER):
+                if opened:
+                    opened.pop()
+                else:
+                    unmatched.add(i)
+        unmatched.update(opened)
+        stack = [self]
+        for i, record in enumerate(records):
+            divider = None if i in unmatched else record['divider']
+            parent = stack[-1]
+            if divider == BOUNDING_SECTION_DIVIDER:
+                group = Group(self, parent)
+                parent._layers.append(group)
+                stack.append(group)
+            elif divider in (OPEN_FOLDER, CLOSED_FOLDER):
+                if record['artboard']:
+                    # The bbox of an artboard is not that of its layers
+                    raise UnsupportedFile('Artboards are not supported')
+                group = stack.pop()
+                group.name = record['name']
+                group.visible = record['visible']
+                group.clipping = record['clipping']
+                group.channels = record['channels']
+            else:
+                parent._layers.append(Layer(self, parent, record['name'], record['bbox'],
+                                            record['visible'], record['clipping'],
+                                            record['channels']))
+
+
+def channel_bytes(layer, channel):
+    '''
+    channel_bytes(Layer layer, Channel channel) -> bytes data
+
+        Returns the (still compressed) data of channel of layer.
+    '''
+
+    return layer.psd.buffer()[channel.offset:channel.offset + channel.length].tobytes()
+
+
+def _rle_headers(data, starts, ends, row_size):
+    # Walks the packet headers of all rows at once, one packet per row
+    # per iteration. Returns the positions of the headers and the
+    # position and count of the repeated byte of every repeat packet.
+    # Returns None when a row isn't exactly row_size bytes.
+    position = starts.astype(numpy.int64)
+    ends = ends.astype(numpy.int64)
+    columns = numpy.zeros(len(starts), dtype=numpy.int64)
+    if (position >= ends).any():
+        return None
+    headers = []
+    while len(position):
+        header = data[position]
+        headers.append(position)
+        position = position + _PACKET_SIZES[header]
+        columns += _PACKET_COUNTS[header]
+        going = (position < ends) & (columns < row_size)
+        if not going.all():
+            done = ~going
+            if (position[done] != ends[done]).any() or (columns[done] != row_size).any():
+                return None
+            position = position[going]
+            ends = ends[going]
+            columns = columns[going]
+    headers = numpy.concatenate(headers)
+    header = data[headers]
+    repeat = (header > 128)
+    return headers, headers[repeat] + 1, _PACKET_COUNTS[header[repeat]]
+
+
+def _rle_packets(data, starts, ends, row_size):
+    # Like _rle_headers(), for rows that are too short or too long.
+    # Returns per packet that has bytes its row, its position in the
+    # row, the position of its first byte, its length (clipped to the
+    # row and to the data of the row) and whether its bytes are copied.
+    position = starts.astype(numpy.int64)
+    ends = ends.astype(numpy.int64)
+    columns = numpy.zeros(len(starts), dtype=numpy.int64)
+    active = numpy.flatnonzero(position < ends)
+    packets = [(numpy.empty(0, dtype=numpy.int64),) * 4 + (numpy.empty(0, dtype=bool),)]
+    while len(active):
+        header = data[position[active]].view(numpy.int8).astype(numpy.int64)
+        literal = header >= 0
+        # -128 is no packet at all
+        count = numpy.where(literal, header + 1, numpy.where(header == -128, 0, 1 - header))
+        source = position[active] + 1
+        column = columns[active]
+        length = numpy.minimum(count, row_size - column)
+        length = numpy.where(literal, numpy.minimum(length, ends[active] - source),
+                             numpy.where(source < ends[active], length, 0))
+        valid = length > 0
+        packets.append((active[valid], column[valid], source[valid], length[valid], literal[valid]))
+        position[active] = numpy.where(literal, source + count, numpy.where(count > 0, source + 1, source))
+        columns[active] += count
+        active = active[(position[active] < ends[active]) & (columns[active] < row_size)]
+    return tuple(numpy.concatenate(parts) for parts in zip(*packets))
+
+
+def _expand_packets(data, starts, ends, row_size):
+    # Copies the bytes of the packets to their rows one by one, for
+    # rows that are too short or too long
+    pixels = numpy.zeros(len(starts) * row_size, dtype=numpy.uint8)
+    packet_rows, columns, sources, lengths, literal = _rle_packets(data, starts, ends, row_size)
+    ends = numpy.cumsum(lengths)
+    # In chunks, the index arrays are 8 bytes per byte
+    first = 0
+    while first < len(lengths):
+        last = int(numpy.searchsorted(ends, ends[first] - lengths[first] + _RLE_CHUNK, 'right'))
+        last = max(last, first + 1)
+        chunk_lengths = lengths[first:last]
+        packet_starts = numpy.cumsum(chunk_lengths) - chunk_lengths
+        in_packet = numpy.arange(int(chunk_lengths.sum()), dtype=numpy.int64)
+        in_packet -= numpy.repeat(packet_starts, chunk_lengths)
+        source = numpy.repeat(sources[first:last], chunk_lengths)
+        source += in_packet * numpy.repeat(literal[first:last], chunk_lengths)
+        target = numpy.repeat(packet_rows[first:last] * row_size + columns[first:last], chunk_lengths)
+        target += in_packet
+        pixels[target] = data[source]
+        first = last
+    return pixels.reshape(len(starts), row_size)
+
+
+def decode_rle(data, starts, ends, row_size):
+    '''
+    decode_rle(numpy.ndarray data, numpy.ndarray starts, numpy.ndarray ends,
+               int row_size) -> numpy.ndarray pixels
+
+        Decodes PackBits compressed rows, row r is data[starts[r]:ends[r]].
+        Returns the (rows, row_size) decoded bytes. Only the packet
+        headers are walked in Python, vectorized over all rows, the bytes
+        are expanded by numpy. Rows that decode to fewer bytes are
+        padded with zeros, bytes past row_size are dropped.
+    '''
+
+    if not len(starts) or not row_size:
+        return numpy.zeros((len(starts), row_size), dtype=numpy.uint8)
+    packets = _rle_headers(data, starts, ends, row_size)
+    if packets is None:
+        return _expand_packets(data, starts, ends, row_size)
+    headers, repeat_sources, repeat_counts = packets
+    # Every byte from the first row to the last is repeated as often as
+    # it is in the rows: a header not at all, a literal byte once. The
+    # bytes between rows (of other channels) not at all.
+    first = int(starts.min())
+    last = int(ends.max())
+    counts = numpy.ones(last - first, dtype=numpy.intp)
+    order = numpy.argsort(starts, kind='stable')
+    gap_starts = ends[order[:-1]]
+    gap_ends = starts[order[1:]]
+    for gap in numpy.flatnonzero(gap_starts != gap_ends):
+        counts[gap_starts[gap] - first:gap_ends[gap] - first] = 0
+    counts[headers - first] = 0
+    counts[repeat_sources - first] = repeat_counts
+    pixels = numpy.repeat(data[first:last], counts)
+    if order[0] != 0 or (order[1:] != order[:-1] + 1).any():
+        # Rows not in file order
+        unsorted = numpy.empty_like(order)
+        unsorted[order] = numpy.arange(len(order))
+        return pixels.reshape(len(starts), row_size)[unsorted]
+    return pixels.reshape(len(starts), row_size)
+
+
+def _row_size(layer):
+    return layer.width * layer.psd.depth // 8
+
+
+def _rle_rows(layer, channel):
+    # Where the rows of an rle compressed channel are
+    psd = layer.psd
+    data = psd.buffer()
+    start, end = channel.offset, channel.offset + channel.length
+    count_type = numpy.dtype('>u2' if psd.version == 1 else '>u4')
+    counts_end = start + layer.height * count_type.itemsize
+    if counts_end > end:
+        raise ValueError('Broken channel data')
+    counts = data[start:counts_end].view(count_type).astype(numpy.int64)
+    row_ends = numpy.cumsum(counts) + counts_end
+    row_starts = row_ends - counts
+    return numpy.minimum(row_starts, end), numpy.minimum(row_ends, end)
+
+
+def _decode_channel(layer, channel):
+    # Returns the decoded bytes of the rows of a raw or zip compressed
+    # channel
+    psd = layer.psd
+    data = psd.buffer()
+    row_size = _row_size(layer)
+    size = layer.height * row_size
+    start, end = channel.offset, channel.offset + channel.length
+    if channel.compression == RAW:
+        pixels = data[start:min(end, start + size)]
+        if len(pixels) < size:
+            pixels = numpy.concatenate((pixels, numpy.zeros(size - len(pixels), numpy.uint8)))
+        return pixels.reshape(layer.height, row_size)
+    if channel.compression not in (ZIP, ZIP_PREDICTION):
+        raise ValueError('Unknown compression {}'.format(channel.compression))
+    try:
+        pixels = zlib.decompress(data[start:end])
+    except zlib.error as err:
+        raise ValueError('Broken channel data: {}'.format(err))
+    pixels = numpy.frombuffer(pixels, dtype=numpy.uint8)
+    if len(pixels) != size:
+        raise ValueError('Broken channel data')
+    pixels = pixels.reshape(layer.height, row_size)
+    if channel.compression == ZIP_PREDICTION:
+        # Every value is stored as the difference with the one before it
+        if psd.depth == 16:
+            pixels = pixels.view('>u2').cumsum(axis=1, dtype=numpy.uint16).astype('>u2')
+            pixels = pixels.view(numpy.uint8)
+        else:
+            pixels = pixels.cumsum(axis=1, dtype=numpy.uint8)
+    return pixels
+
+
+def decode_channels(layer, channel_ids):
+    '''
+    decode_channels(Layer layer, list channel_ids) -> list channels
+
+        Decodes the channels of layer with channel_ids. Returns them in
+        that order, as (height, width) arrays of 8 bit values, 16 bit
+        values are scaled down. The rle compressed channels are decoded
+        together, in one pass.
+
+        Raises ValueError when a channel is missing or broken.
+    '''
+
+    channels = {channel.id: channel for channel in layer.channels}
+    if any(channel_id not in channels for channel_id in channel_ids):
+        raise ValueError('Layer {} misses channels'.format(layer.name))
+    height = layer.height
+    decoded = {}
+    # In file order, so the rows are one after the other
+    rle = sorted((channel_id for channel_id in channel_ids
+                  if channels[channel_id].compression == RLE),
+                 key=lambda channel_id: channels[channel_id].offset)
+    if rle and height and layer.width:
+        starts, ends = zip(*(_rle_rows(layer, channels[channel_id]) for channel_id in rle))
+        data = decode_rle(layer.psd.buffer(), numpy.concatenate(starts), numpy.concatenate(ends),
+                          _row_size(layer))
+        for i, channel_id in enumerate(rle):
+            decoded[channel_id] = data[i * height:(i + 1) * height]
+    planes = []
+    for channel_id in channel_ids:
+        plane = decoded.get(channel_id)
+        if plane is None:
+            plane = _decode_channel(layer, channels[channel_id])
+        if layer.psd.depth == 16:
+            # Like psd_tools: the 16 bit value / 256
+            plane = (plane.view('>u2') >> 8).astype(numpy.uint8)
+        planes.append(plane)
+    return planes
+
+
+def _bbox_of(mask):
+    rows = numpy.flatnonzero(mask.any(axis=1))
+    if not len(rows):
+        return None
+    columns = numpy.flatnonzero(mask.any(axis=0))
+    return (int(columns[0]), int(rows[0]), int(columns[-1]) + 1, int(rows[-1]) + 1)
+
+
+def decode_layer(layer, crop):
+    '''
+    decode_layer(Layer layer, bool crop) -> numpy.ndarray pixels, tuple bbox
+
+        Decodes layer into an array of (height, width, 4) RGBA values,
+        or RGB when it has no transparency. With crop the pixels are
+        cropped to their bounding box (relative to the layer), which is
+        returned too. Without crop or when the layer is fully transparent
+        bbox is None.
+
+        Raises ValueError when the layer can't be decoded.
+    '''
+
+    if layer.is_group() or not layer.width or not layer.height:
+        raise ValueError('Layer {} has no pixels'.format(layer.name))
+    has_alpha = any(channel.id == -1 for channel in layer.channels)
+    planes = decode_channels(layer, (0, 1, 2, -1) if has_alpha else (0, 1, 2))
+    bbox = None
+    if crop:
+        # Like PIL's getbbox(): the transparency, or any color without it
+        bbox = _bbox_of(planes[3] if has_alpha else planes[0] | planes[1] | planes[2])
+    left, top, right, bottom = bbox or (0, 0, layer.width, layer.height)
+    # Only the cropped pixels are interleaved
+    pixels = numpy.empty((bottom - top, right - left, len(planes)), dtype=numpy.uint8)
+    for i, plane in enumerate(planes):
+        pixels[..., i] = plane[top:bottom, left:right]
+    return pixels, bbox